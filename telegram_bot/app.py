@@ -7,11 +7,17 @@ Este bot permite a usuarios subir contenido HTML e imágenes a sus sitios web.
 """
 
 import os
+import asyncio
 import logging
 from dotenv import load_dotenv
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler
 from telegram import BotCommand
 
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 # Importar desde nuestro módulo de compatibilidad
 from utils.compat import Filters, CallbackContext
 
@@ -33,8 +39,8 @@ from core.handlers import (
     message_handler,
     whoami_command
 )
-from core.middlewares import setup_middlewares
-from database.connection import setup_database
+from core.middlewares import setup_middlewares, start_activity_flush, stop_activity_flush
+from database.connection import setup_database, close_connection
 from modules import setup_all_modules
 from modules.auth import setup_auth_handlers
 from modules.content import setup_content_handlers
@@ -86,6 +92,18 @@ async def setup_bot_commands(application):
     
     await application.bot.set_my_commands(commands)
 
+async def post_init(application):
+    """Tareas a ejecutar cuando la aplicación ya está inicializada."""
+    await setup_bot_commands(application)
+    # Volcado periódico de la última actividad de los usuarios
+    start_activity_flush()
+
+async def post_shutdown(application):
+    """Tareas a ejecutar al detener la aplicación."""
+    # Detener el volcado periódico y escribir la actividad pendiente
+    await stop_activity_flush()
+    close_connection()
+
 def main():
     """Función principal para ejecutar el bot."""
     # Obtener el token del bot desde variables de entorno
@@ -100,7 +118,16 @@ def main():
         logger.error("❌ No se pudo conectar a la base de datos SQLite")
         return
 
+    # Usar uvloop como bucle de eventos si está instalado. Se fija la política
+    # antes de construir la aplicación (uvloop.install() está obsoleto desde 0.21)
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        logger.info("Usando uvloop como bucle de eventos")
+    
     # Inicializar el bot
+    # No se configura Defaults(parse_mode=ParseMode.HTML): muchos mensajes se envían
+    # como texto plano con datos del usuario (nombres, títulos) y pasarían a
+    # interpretarse como HTML. Cada llamada indica su parse_mode explícitamente.
     application = Application.builder().token(token).build()
     
     # Configurar middlewares
@@ -129,8 +156,9 @@ def main():
     # Manejador global de errores
     application.add_error_handler(error_handler)
     
-    # Configurar menú de comandos persistente
-    application.post_init = setup_bot_commands
+    # Configurar menú de comandos persistente y tareas de arranque/parada
+    application.post_init = post_init
+    application.post_shutdown = post_shutdown
     
     # Iniciar el bot
     logger.info("🚀 Bot iniciado correctamente. Presiona Ctrl+C para detener.")
@@ -2,9 +2,12 @@
 Middlewares para el bot de Telegram.
 """
 
+import asyncio
 import logging
 from telegram import Update
-from telegram.ext import ContextTypes
+from telegram.ext import ContextTypes, TypeHandler
+
+from models.user import User, LAST_ACTIVE_FLUSH_INTERVAL
 
 # Configuración de logging
 logger = logging.getLogger(__name__)
@@ -41,6 +44,42 @@ async def user_access_check(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # De momento, permitir todos los accesos
     return True
 
+async def track_user_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Registrar la última actividad del usuario que envía el update.
+    No responde ni detiene el update: los demás handlers lo procesan igual.
+    """
+    if update.effective_user:
+        # Solo se anota el ID; no se consulta la base de datos en cada update
+        User.record_activity(update.effective_user.id)
+
+# Tarea que vuelca periódicamente la actividad pendiente
+_flush_task = None
+
+async def _last_active_flush_loop(interval):
+    """Volcar periódicamente a la base de datos la actividad pendiente."""
+    while True:
+        await asyncio.sleep(interval)
+        User.flush_last_active()
+
+def start_activity_flush(interval=LAST_ACTIVE_FLUSH_INTERVAL):
+    """Iniciar el volcado periódico de la actividad (con el bucle de eventos ya en marcha)."""
+    global _flush_task
+    if _flush_task is None:
+        _flush_task = asyncio.create_task(_last_active_flush_loop(interval))
+
+async def stop_activity_flush():
+    """Detener el volcado periódico y escribir la actividad que quede pendiente."""
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        try:
+            await _flush_task
+        except asyncio.CancelledError:
+            pass
+        _flush_task = None
+    User.flush_last_active()
+
 def setup_middlewares(application):
     """
     Configurar middlewares para la aplicación.
@@ -49,7 +88,8 @@ def setup_middlewares(application):
     # En esta versión, simplemente registramos que la función fue llamada
     logger.info("Configuración de middlewares: los middlewares tradicionales no están disponibles en python-telegram-bot 20.x")
     
-    # En lugar de middlewares, se pueden usar los handlers y event handlers
-    # application.add_handler(...)
+    # En lugar de middlewares, se usan handlers en un grupo de prioridad máxima
+    # que se ejecutan antes que el resto para cualquier update
+    application.add_handler(TypeHandler(Update, track_user_activity), group=-100)
     
     logger.info("Middlewares configurados correctamente (simulado)") 
\ No newline at end of file
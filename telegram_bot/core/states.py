@@ -3,7 +3,7 @@ Gestión de estados para las conversaciones del bot.
 """
 
 from enum import Enum, auto
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterable, List, Optional
 import json
 import logging
 from database.connection import get_db
@@ -11,6 +11,10 @@ from database.connection import get_db
 # Configuración de logging
 logger = logging.getLogger(__name__)
 
+# Número de mensajes recientes que se recuerdan para detectar duplicados
+RECENT_IDS_WINDOW = 64
+_RECENT_IDS_MASK = (1 << RECENT_IDS_WINDOW) - 1
+
 class State(Enum):
     """Estados posibles para las conversaciones."""
     IDLE = auto()                 # Estado inicial
@@ -147,6 +151,10 @@ class StateManager:
             self.conversations[user_id] = ConversationData()
         return self.conversations[user_id]
     
+    def find_conversation(self, user_id: int) -> Optional[ConversationData]:
+        """Obtiene la conversación de un usuario sin crearla si no existe."""
+        return self.conversations.get(user_id)
+    
     def set_state(self, user_id: int, state: State) -> None:
         """Actualiza el estado de un usuario y lo guarda en la base de datos."""
         self.get_conversation(user_id).update_state(state)
@@ -162,10 +170,58 @@ class StateManager:
         self.get_conversation(user_id).set_data(key, value)
         self._save_to_db(user_id)
     
+    def set_data_many(self, user_id: int, data: Dict[str, Any], state: Optional[State] = None) -> None:
+        """Guarda varios datos (y opcionalmente el estado) de un usuario con una sola escritura en la base de datos."""
+        conversation = self.get_conversation(user_id)
+        if state is not None:
+            conversation.update_state(state)
+        conversation.data.update(data)
+        self._save_to_db(user_id)
+        if state is not None:
+            logger.info(f"Estado de usuario {user_id} actualizado a {state.name}")
+    
+    def mark_processed_if_new(self, user_id: int, message_id: int) -> bool:
+        """
+        Marca un mensaje como procesado si no se había procesado ya.
+
+        Se guarda el ID más alto procesado y una máscara de bits con los
+        RECENT_IDS_WINDOW mensajes anteriores (bit n = ID más alto - n), de modo
+        que un mensaje que llega desordenado dentro de la ventana no se descarta.
+        La comparación y la escritura se hacen sin ceder el control al bucle de
+        eventos, así que dos actualizaciones duplicadas no pueden pasar ambas.
+
+        Returns:
+            bool: True si el mensaje es nuevo, False si ya se había procesado.
+        """
+        conversation = self.get_conversation(user_id)
+        last_processed = conversation.get_data("last_processed_message_id", 0)
+        mask = conversation.get_data("processed_ids_mask", 1 if last_processed else 0)
+        
+        if message_id > last_processed:
+            shift = message_id - last_processed
+            mask = ((mask << shift) | 1) & _RECENT_IDS_MASK if shift < RECENT_IDS_WINDOW else 1
+            last_processed = message_id
+        else:
+            offset = last_processed - message_id
+            # Fuera de la ventana se considera ya procesado
+            if offset >= RECENT_IDS_WINDOW or mask & (1 << offset):
+                return False
+            mask |= 1 << offset
+        
+        conversation.data["last_processed_message_id"] = last_processed
+        conversation.data["processed_ids_mask"] = mask
+        self._save_to_db(user_id)
+        return True
+    
     def get_data(self, user_id: int, key: str, default: Any = None) -> Any:
         """Recupera un dato de un usuario."""
         return self.get_conversation(user_id).get_data(key, default)
     
+    def get_data_many(self, user_id: int, keys: Iterable[str]) -> List[Any]:
+        """Recupera varios datos de un usuario, en el mismo orden que las claves (None si faltan)."""
+        data = self.get_conversation(user_id).data
+        return [data.get(key) for key in keys]
+    
     def clear_user_data(self, user_id: int) -> None:
         """Limpia todos los datos de un usuario."""
         if user_id in self.conversations:
@@ -8,6 +8,7 @@ Módulo de conexión a SQLite
 import os
 import logging
 import sqlite3
+import threading
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
@@ -16,11 +17,24 @@ logger = logging.getLogger(__name__)
 connection = None
 cursor = None
 
+# Hilo propietario de la conexión global. sqlite3 no permite usar una conexión
+# desde otro hilo, así que los hilos de trabajo (asyncio.to_thread) abren la suya.
+_connection_thread_id = None
+_thread_local = threading.local()
+
+# Conexiones abiertas por los hilos de trabajo, para cerrarlas en close_connection
+_worker_connections = set()
+_worker_connections_lock = threading.Lock()
+
+def _get_db_path():
+    """Obtener la ruta del fichero de base de datos."""
+    return os.getenv("DATABASE_PATH", "./database/knomad.db")
+
 def setup_database():
     """Configurar la conexión a SQLite."""
-    global connection, cursor
+    global connection, cursor, _connection_thread_id
     
-    db_path = os.getenv("DATABASE_PATH", "./database/knomad.db")
+    db_path = _get_db_path()
     
     # Asegurarse de que el directorio existe
     db_dir = os.path.dirname(db_path)
@@ -29,9 +43,10 @@ def setup_database():
     
     try:
         # Conectar a SQLite
-        connection = sqlite3.connect(db_path)
+        connection = sqlite3.connect(db_path, cached_statements=256)
         connection.row_factory = sqlite3.Row  # Para acceder a columnas por nombre
         cursor = connection.cursor()
+        _connection_thread_id = threading.get_ident()
         
         logger.info("✅ Conexión a SQLite establecida correctamente")
         
@@ -56,10 +71,20 @@ def _setup_tables():
         email TEXT UNIQUE,
         status TEXT,
         role TEXT DEFAULT 'user',
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_active TIMESTAMP
     )
     ''')
     
+    # Migración: añadir last_active a bases de datos creadas sin esa columna
+    cursor.execute('PRAGMA table_info(users)')
+    if 'last_active' not in {row['name'] for row in cursor.fetchall()}:
+        cursor.execute('ALTER TABLE users ADD COLUMN last_active TIMESTAMP')
+    
+    # telegram_id y email ya tienen índice por su restricción UNIQUE;
+    # el índice por estado acelera User.count_active
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_status ON users(status)')
+    
     # Tabla de sitios
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS sites (
@@ -94,6 +119,8 @@ def _setup_tables():
     ''')
     
     # Tabla de placeholders personalizados
+    # UNIQUE (site_id, placeholder_name) crea el índice compuesto que usa
+    # CustomPlaceholder.get_by_placeholder_name, no hace falta otro índice.
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS custom_placeholders (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -117,11 +144,35 @@ def get_db():
     global connection, cursor
     if connection is None:
         setup_database()
-    return connection, cursor
+    if threading.get_ident() == _connection_thread_id:
+        return connection, cursor
+    
+    # Conexión propia para hilos de trabajo (se vuelve a abrir si se cerró)
+    thread_connection = getattr(_thread_local, "connection", None)
+    if thread_connection is None or thread_connection not in _worker_connections:
+        # check_same_thread=False solo para poder cerrarla desde close_connection;
+        # cada conexión la sigue usando únicamente su hilo
+        thread_connection = sqlite3.connect(_get_db_path(), cached_statements=256, check_same_thread=False)
+        thread_connection.row_factory = sqlite3.Row
+        with _worker_connections_lock:
+            _worker_connections.add(thread_connection)
+        _thread_local.connection = thread_connection
+        _thread_local.cursor = thread_connection.cursor()
+    return _thread_local.connection, _thread_local.cursor
 
 def close_connection():
-    """Cerrar la conexión a SQLite."""
-    global connection
+    """Cerrar la conexión a SQLite y las de los hilos de trabajo."""
+    global connection, cursor
+    with _worker_connections_lock:
+        worker_connections = list(_worker_connections)
+        _worker_connections.clear()
+    for worker_connection in worker_connections:
+        try:
+            worker_connection.close()
+        except sqlite3.Error as e:
+            logger.error(f"Error al cerrar una conexión de hilo de trabajo: {e}")
     if connection:
         connection.close()
+        connection = None
+        cursor = None
         logger.info("Conexión a SQLite cerrada") 
\ No newline at end of file
@@ -7,14 +7,42 @@ Modelo de datos para los sitios web
 
 import logging
 import json
-from datetime import datetime
+from collections import defaultdict
 from database.connection import get_db
 
 logger = logging.getLogger(__name__)
 
+# Columnas de la tabla sites en el orden que espera Site.from_db_row
+SITE_COLUMNS = "id, user_id, name, domain, sftp_config, template, status, created_at"
+
+# Sentencias SQL reutilizadas (la misma cadena aprovecha la caché de sentencias de sqlite3)
+_SQL_INSERT_SITE = (
+    "INSERT INTO sites (user_id, name, domain, sftp_config, template, status) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+_SQL_SELECT_BY_ID = f"SELECT {SITE_COLUMNS} FROM sites WHERE id = ?"
+_SQL_SELECT_CREATED_AT = "SELECT created_at FROM sites WHERE id = ?"
+_SQL_SELECT_BY_USER = f"SELECT {SITE_COLUMNS} FROM sites WHERE user_id = ?"
+_SQL_UPDATE_SITE = (
+    "UPDATE sites SET user_id = ?, name = ?, domain = ?, sftp_config = ?, template = ?, status = ? "
+    "WHERE id = ?"
+)
+_SQL_DELETE_SITE = "DELETE FROM sites WHERE id = ?"
+
+def _strip_braces(placeholder_name):
+    """Eliminar las llaves {{ }} de un nombre de placeholder si están presentes."""
+    if placeholder_name.startswith('{{') and placeholder_name.endswith('}}'):
+        return placeholder_name[2:-2]
+    return placeholder_name
+
 class Site:
     """Clase para manejar sitios web de los usuarios."""
 
+    __slots__ = (
+        'id', 'user_id', 'name', 'domain', '_sftp_config_raw', '_sftp_config_cache',
+        'template', 'status', 'created_at', '_custom_placeholders', '_placeholders_by_id'
+    )
+
     def __init__(self, id=None, user_id=None, name=None, domain=None, sftp_config=None, 
                  template="default", status="active", created_at=None):
         """
@@ -34,11 +62,29 @@ class Site:
         self.user_id = user_id
         self.name = name
         self.domain = domain
-        self.sftp_config = sftp_config
+        self._sftp_config_raw = None  # JSON sin decodificar leído de la base de datos
+        self._sftp_config_cache = sftp_config
         self.template = template
         self.status = status
-        self.created_at = created_at or datetime.now()
-        self._custom_placeholders = None  # Caché de placeholders
+        self.created_at = created_at
+        self._custom_placeholders = None  # Caché de placeholders por nombre
+        self._placeholders_by_id = None  # Índice secundario de la caché por ID
+
+    @property
+    def sftp_config(self):
+        """Configuración SFTP, decodificada del JSON de la base de datos en el primer acceso."""
+        if self._sftp_config_raw is not None:
+            try:
+                self._sftp_config_cache = json.loads(self._sftp_config_raw)
+            except json.JSONDecodeError:
+                self._sftp_config_cache = {}
+            self._sftp_config_raw = None
+        return self._sftp_config_cache
+
+    @sftp_config.setter
+    def sftp_config(self, value):
+        self._sftp_config_cache = value
+        self._sftp_config_raw = None
 
     def to_dict(self):
         """Convertir el objeto a un diccionario."""
@@ -73,17 +119,24 @@ class Site:
         if not row:
             return None
             
-        # Convertir el objeto Row a diccionario
-        data = {key: row[key] for key in row.keys()}
+        # La fila debe seguir el orden de SITE_COLUMNS
+        id, user_id, name, domain, sftp_config, template, status, created_at = row
         
-        # Convertir el campo sftp_config de JSON a diccionario
-        if data.get("sftp_config"):
-            try:
-                data["sftp_config"] = json.loads(data["sftp_config"])
-            except json.JSONDecodeError:
-                data["sftp_config"] = {}
-                
-        return cls.from_dict(data)
+        site = cls(
+            id=id,
+            user_id=user_id,
+            name=name,
+            domain=domain,
+            sftp_config=sftp_config,
+            template=template,
+            status=status,
+            created_at=created_at
+        )
+        
+        # El JSON de sftp_config se decodifica solo si se accede a él
+        if sftp_config:
+            site._sftp_config_raw = sftp_config
+        return site
 
     @classmethod
     async def create(cls, data):
@@ -102,10 +155,7 @@ class Site:
             # Convertir la configuración SFTP a JSON
             sftp_config = json.dumps(data.get("sftp_config", {})) if data.get("sftp_config") else None
             
-            cur.execute('''
-                INSERT INTO sites (user_id, name, domain, sftp_config, template, status)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
+            cur.execute(_SQL_INSERT_SITE, (
                 data.get("user_id"),
                 data.get("name"),
                 data.get("domain"),
@@ -118,7 +168,7 @@ class Site:
             conn.commit()
             
             # Obtener el sitio recién creado
-            cur.execute('SELECT * FROM sites WHERE id = ?', (site_id,))
+            cur.execute(_SQL_SELECT_BY_ID, (site_id,))
             site_data = cur.fetchone()
             
             if site_data:
@@ -129,6 +179,48 @@ class Site:
             logger.error(f"Error al crear sitio: {e}")
             return None
 
+    @classmethod
+    def bulk_create(cls, rows):
+        """
+        Crear varios sitios en una sola transacción.
+
+        A diferencia de create(), no devuelve los objetos creados: lastrowid
+        no es fiable con executemany, así que quien necesite los IDs debe
+        volver a consultarlos (por ejemplo con get_by_user_id).
+
+        Args:
+            rows (list): Lista de diccionarios con los datos de cada sitio.
+
+        Returns:
+            int: Número de sitios insertados (0 en caso de error).
+        """
+        if not rows:
+            return 0
+
+        conn, cur = get_db()
+
+        try:
+            params = [
+                (
+                    data.get("user_id"),
+                    data.get("name"),
+                    data.get("domain"),
+                    json.dumps(data["sftp_config"]) if data.get("sftp_config") else None,
+                    data.get("template", "default"),
+                    data.get("status", "active")
+                )
+                for data in rows
+            ]
+
+            cur.executemany(_SQL_INSERT_SITE, params)
+
+            conn.commit()
+            return cur.rowcount
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error al crear sitios en bloque: {e}")
+            return 0
+
     @classmethod
     def get_by_id(cls, site_id):
         """
@@ -143,7 +235,7 @@ class Site:
         conn, cur = get_db()
         
         try:
-            cur.execute('SELECT * FROM sites WHERE id = ?', (site_id,))
+            cur.execute(_SQL_SELECT_BY_ID, (site_id,))
             site_data = cur.fetchone()
             
             if site_data:
@@ -167,7 +259,7 @@ class Site:
         conn, cur = get_db()
         
         try:
-            cur.execute('SELECT * FROM sites WHERE user_id = ?', (user_id,))
+            cur.execute(_SQL_SELECT_BY_USER, (user_id,))
             sites_data = cur.fetchall()
             
             return [cls.from_db_row(site) for site in sites_data]
@@ -175,6 +267,48 @@ class Site:
             logger.error(f"Error al obtener sitios por user_id: {e}")
             return []
 
+    @classmethod
+    def get_by_user_id_with_placeholders(cls, user_id):
+        """
+        Obtener sitios de un usuario con sus placeholders ya cargados.
+
+        Realiza solo dos consultas (sitios + placeholders con IN) en lugar
+        de una consulta adicional por sitio al llamar a get_custom_placeholders().
+
+        Args:
+            user_id (int): ID del usuario.
+
+        Returns:
+            list: Lista de objetos Site con la caché de placeholders poblada.
+        """
+        from models.placeholder import CustomPlaceholder
+
+        conn, cur = get_db()
+
+        try:
+            cur.execute(_SQL_SELECT_BY_USER, (user_id,))
+            sites = [cls.from_db_row(site) for site in cur.fetchall()]
+
+            if not sites:
+                return []
+
+            # Cargar todos los placeholders de los sitios en una sola consulta
+            site_ids = [site.id for site in sites]
+            marks = ", ".join("?" * len(site_ids))
+            cur.execute(f'SELECT * FROM custom_placeholders WHERE site_id IN ({marks})', site_ids)
+
+            grouped = defaultdict(list)
+            for row in cur.fetchall():
+                grouped[row["site_id"]].append(CustomPlaceholder.from_db_row(row))
+
+            for site in sites:
+                site._cache_placeholders(grouped[site.id])
+
+            return sites
+        except Exception as e:
+            logger.error(f"Error al obtener sitios con placeholders por user_id: {e}")
+            return []
+
     def save(self):
         """
         Guardar o actualizar el sitio en la base de datos.
@@ -185,16 +319,16 @@ class Site:
         conn, cur = get_db()
         
         try:
-            # Convertir la configuración SFTP a JSON
-            sftp_config = json.dumps(self.sftp_config) if self.sftp_config else None
+            # Convertir la configuración SFTP a JSON (si nunca se decodificó, se
+            # reutiliza el JSON original tal cual)
+            if self._sftp_config_raw is not None:
+                sftp_config = self._sftp_config_raw
+            else:
+                sftp_config = json.dumps(self.sftp_config) if self.sftp_config else None
             
             if self.id:
                 # Actualizar sitio existente
-                cur.execute('''
-                    UPDATE sites
-                    SET user_id = ?, name = ?, domain = ?, sftp_config = ?, template = ?, status = ?
-                    WHERE id = ?
-                ''', (
+                cur.execute(_SQL_UPDATE_SITE, (
                     self.user_id,
                     self.name,
                     self.domain,
@@ -204,11 +338,8 @@ class Site:
                     self.id
                 ))
             else:
-                # Insertar nuevo sitio
-                cur.execute('''
-                    INSERT INTO sites (user_id, name, domain, sftp_config, template, status)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (
+                # Insertar nuevo sitio; created_at lo asigna la base de datos (UTC)
+                cur.execute(_SQL_INSERT_SITE, (
                     self.user_id,
                     self.name,
                     self.domain,
@@ -217,6 +348,8 @@ class Site:
                     self.status
                 ))
                 self.id = cur.lastrowid
+                cur.execute(_SQL_SELECT_CREATED_AT, (self.id,))
+                self.created_at = cur.fetchone()[0]
                 
             conn.commit()
             return True
@@ -238,7 +371,7 @@ class Site:
         conn, cur = get_db()
         
         try:
-            cur.execute('DELETE FROM sites WHERE id = ?', (self.id,))
+            cur.execute(_SQL_DELETE_SITE, (self.id,))
             conn.commit()
             return True
         except Exception as e:
@@ -246,6 +379,11 @@ class Site:
             logger.error(f"Error al eliminar sitio: {e}")
             return False
 
+    def _cache_placeholders(self, placeholders):
+        """Poblar la caché de placeholders (por nombre y por ID)."""
+        self._custom_placeholders = {p.placeholder_name: p for p in placeholders}
+        self._placeholders_by_id = {p.id: p for p in placeholders}
+
     def get_custom_placeholders(self, force_refresh=False):
         """
         Obtener todos los placeholders personalizados del sitio.
@@ -258,8 +396,8 @@ class Site:
         """
         if self._custom_placeholders is None or force_refresh:
             from models.placeholder import CustomPlaceholder
-            self._custom_placeholders = CustomPlaceholder.get_by_site_id(self.id)
-        return self._custom_placeholders
+            self._cache_placeholders(CustomPlaceholder.get_by_site_id(self.id))
+        return list(self._custom_placeholders.values())
         
     def get_custom_placeholder_by_name(self, placeholder_name):
         """
@@ -274,8 +412,11 @@ class Site:
         from models.placeholder import CustomPlaceholder
         
         # Eliminar llaves si están presentes
-        if placeholder_name.startswith('{{') and placeholder_name.endswith('}}'):
-            placeholder_name = placeholder_name[2:-2]
+        placeholder_name = _strip_braces(placeholder_name)
+        
+        # Usar la caché si ya está cargada
+        if self._custom_placeholders is not None:
+            return self._custom_placeholders.get(placeholder_name)
             
         return CustomPlaceholder.get_by_placeholder_name(self.id, placeholder_name)
         
@@ -295,8 +436,7 @@ class Site:
         from models.placeholder import CustomPlaceholder
         
         # Eliminar llaves si están presentes
-        if placeholder_name.startswith('{{') and placeholder_name.endswith('}}'):
-            placeholder_name = placeholder_name[2:-2]
+        placeholder_name = _strip_braces(placeholder_name)
             
         # Crear el nuevo placeholder
         placeholder_data = {
@@ -311,7 +451,8 @@ class Site:
         
         # Actualizar caché
         if new_placeholder and self._custom_placeholders is not None:
-            self._custom_placeholders.append(new_placeholder)
+            self._custom_placeholders[new_placeholder.placeholder_name] = new_placeholder
+            self._placeholders_by_id[new_placeholder.id] = new_placeholder
             
         return new_placeholder
         
@@ -341,13 +482,55 @@ class Site:
         
         # Actualizar caché
         if success and self._custom_placeholders is not None:
-            for i, p in enumerate(self._custom_placeholders):
-                if p.id == placeholder_id:
-                    self._custom_placeholders[i] = placeholder
-                    break
+            old = self._placeholders_by_id.pop(placeholder_id, None)
+            if old is not None:
+                self._custom_placeholders.pop(old.placeholder_name, None)
+            self._custom_placeholders[placeholder.placeholder_name] = placeholder
+            self._placeholders_by_id[placeholder_id] = placeholder
                     
         return success
         
+    def replace_custom_placeholders(self, new_specs):
+        """
+        Reemplazar todos los placeholders personalizados del sitio en una sola transacción.
+
+        Args:
+            new_specs (list): Lista de diccionarios con placeholder_name, display_name
+                y opcionalmente placeholder_type y options.
+
+        Returns:
+            bool: True si se reemplazaron correctamente, False en caso contrario.
+        """
+        conn, cur = get_db()
+
+        try:
+            params = [
+                (
+                    self.id,
+                    _strip_braces(spec["placeholder_name"]),
+                    spec.get("display_name"),
+                    spec.get("placeholder_type", "texto"),
+                    spec.get("options")
+                )
+                for spec in new_specs
+            ]
+
+            cur.execute('DELETE FROM custom_placeholders WHERE site_id = ?', (self.id,))
+            cur.executemany('''
+                INSERT INTO custom_placeholders (site_id, placeholder_name, display_name, placeholder_type, options)
+                VALUES (?, ?, ?, ?, ?)
+            ''', params)
+            conn.commit()
+            return True
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error al reemplazar placeholders del sitio: {e}")
+            return False
+        finally:
+            # Forzar la recarga de la caché en el próximo acceso
+            self._custom_placeholders = None
+            self._placeholders_by_id = None
+
     def delete_custom_placeholder(self, placeholder_id):
         """
         Eliminar un placeholder personalizado.
@@ -360,7 +543,10 @@ class Site:
         """
         from models.placeholder import CustomPlaceholder
         
-        placeholder = CustomPlaceholder.get_by_id(placeholder_id)
+        if self._placeholders_by_id is not None:
+            placeholder = self._placeholders_by_id.get(placeholder_id)
+        else:
+            placeholder = CustomPlaceholder.get_by_id(placeholder_id)
         if not placeholder or placeholder.site_id != self.id:
             return False
             
@@ -368,6 +554,7 @@ class Site:
         
         # Actualizar caché
         if success and self._custom_placeholders is not None:
-            self._custom_placeholders = [p for p in self._custom_placeholders if p.id != placeholder_id]
+            self._placeholders_by_id.pop(placeholder_id, None)
+            self._custom_placeholders.pop(placeholder.placeholder_name, None)
             
         return success 
\ No newline at end of file
@@ -5,25 +5,60 @@ Este módulo define la estructura y métodos para trabajar con etiquetas
 que se utilizarán en los contenidos del sitio.
 """
 
+import base64
 import json
+import os
+from collections import Counter
+from contextlib import contextmanager
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 import logging
 
 from utils.file_operations import read_json_file, write_json_file
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 # Logger
 logger = logging.getLogger(__name__)
 
 # Ruta al archivo de etiquetas
 DATA_DIR = Path('data')
 TAGS_FILE = DATA_DIR / 'tags.json'
+# tags.json se reemplaza con os.replace al escribir, así que el bloqueo
+# se hace sobre un archivo aparte que nunca cambia de inode
+TAGS_LOCK_FILE = DATA_DIR / 'tags.json.lock'
+
+# Caché en memoria de las etiquetas, invalidada por mtime del archivo.
+# Los objetos en caché son compartidos: get_all/get_by_* devuelven copias.
+_CACHE: Optional[List['Tag']] = None
+_CACHE_MTIME = 0
+_BY_NAME_LOWER: Dict[str, 'Tag'] = {}
+_BY_ID: Dict[str, 'Tag'] = {}
+
+@contextmanager
+def _tags_file_lock():
+    """Bloqueo exclusivo para las operaciones de lectura-modificación-escritura."""
+    if fcntl is None:
+        yield
+        return
+    
+    with open(TAGS_LOCK_FILE, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
 
 class Tag:
     """
     Clase que representa una etiqueta del sitio.
     """
     
+    __slots__ = ('id', 'name', 'post_count')
+    
     def __init__(self, name: str, post_count: int = 0, tag_id: Optional[str] = None):
         """
         Inicializa una nueva etiqueta.
@@ -42,14 +77,14 @@ class Tag:
         Genera un ID único para la etiqueta.
         
         Returns:
-            ID único basado en el nombre de la etiqueta
+            ID aleatorio de 8 caracteres (base32 en minúsculas)
         """
-        import hashlib
-        import time
-        
-        # Generar un hash basado en el nombre y la hora actual
-        unique_string = f"{self.name}_{time.time()}"
-        return hashlib.md5(unique_string.encode()).hexdigest()[:8]
+        # 5 bytes aleatorios = 40 bits = exactamente 8 caracteres base32
+        return base64.b32encode(os.urandom(5)).decode().lower()
+    
+    def _copy(self) -> 'Tag':
+        """Devuelve una copia independiente de la etiqueta."""
+        return Tag(self.name, self.post_count, self.id)
     
     def to_dict(self) -> Dict[str, Any]:
         """
@@ -103,6 +138,38 @@ class Tag:
             write_json_file(TAGS_FILE, default_tags)
             logger.info("Archivo de etiquetas creado con valores predeterminados")
     
+    @staticmethod
+    def _invalidate_cache() -> None:
+        """Fuerza la recarga de la caché de etiquetas en el próximo acceso."""
+        global _CACHE_MTIME
+        _CACHE_MTIME = 0
+    
+    @staticmethod
+    def _load_cache() -> List['Tag']:
+        """
+        Devuelve la lista de etiquetas en caché, recargándola solo si
+        el archivo ha cambiado desde la última lectura.
+        
+        Returns:
+            Lista de objetos Tag en caché
+        """
+        global _CACHE, _CACHE_MTIME, _BY_NAME_LOWER, _BY_ID
+        
+        Tag.ensure_file_exists()
+        
+        mtime = TAGS_FILE.stat().st_mtime_ns
+        if _CACHE is not None and mtime == _CACHE_MTIME:
+            return _CACHE
+        
+        data = read_json_file(TAGS_FILE)
+        tags = [Tag.from_dict(tag) for tag in data.get("tags", [])]
+        
+        _CACHE = tags
+        _BY_NAME_LOWER = {tag.name.lower(): tag for tag in tags}
+        _BY_ID = {tag.id: tag for tag in tags}
+        _CACHE_MTIME = mtime
+        return _CACHE
+    
     @staticmethod
     def get_all() -> List['Tag']:
         """
@@ -111,12 +178,8 @@ class Tag:
         Returns:
             Lista de objetos Tag
         """
-        Tag.ensure_file_exists()
-        
         try:
-            data = read_json_file(TAGS_FILE)
-            tags = data.get("tags", [])
-            return [Tag.from_dict(tag) for tag in tags]
+            return [tag._copy() for tag in Tag._load_cache()]
         except Exception as e:
             logger.error(f"Error al cargar etiquetas: {e}")
             return []
@@ -132,11 +195,13 @@ class Tag:
         Returns:
             Objeto Tag si se encuentra, None en caso contrario
         """
-        tags = Tag.get_all()
-        for tag in tags:
-            if tag.name.lower() == name.lower():
-                return tag
-        return None
+        try:
+            Tag._load_cache()
+        except Exception as e:
+            logger.error(f"Error al cargar etiquetas: {e}")
+            return None
+        tag = _BY_NAME_LOWER.get(name.lower())
+        return tag._copy() if tag is not None else None
     
     @staticmethod
     def get_by_id(tag_id: str) -> Optional['Tag']:
@@ -149,11 +214,13 @@ class Tag:
         Returns:
             Objeto Tag si se encuentra, None en caso contrario
         """
-        tags = Tag.get_all()
-        for tag in tags:
-            if tag.id == tag_id:
-                return tag
-        return None
+        try:
+            Tag._load_cache()
+        except Exception as e:
+            logger.error(f"Error al cargar etiquetas: {e}")
+            return None
+        tag = _BY_ID.get(tag_id)
+        return tag._copy() if tag is not None else None
     
     @staticmethod
     def save(tag: 'Tag') -> bool:
@@ -171,26 +238,29 @@ class Tag:
         Tag.ensure_file_exists()
         
         try:
-            data = read_json_file(TAGS_FILE)
-            tags = data.get("tags", [])
-            
-            # Buscar si ya existe la etiqueta por ID
-            for i, t in enumerate(tags):
-                if t.get("id") == tag.id:
-                    # Actualizar la etiqueta existente
-                    tags[i] = tag.to_dict()
-                    break
-            else:
-                # Si no se encontró, añadir la nueva etiqueta
-                tags.append(tag.to_dict())
-            
-            data["tags"] = tags
-            write_json_file(TAGS_FILE, data)
+            with _tags_file_lock():
+                data = read_json_file(TAGS_FILE)
+                tags = data.get("tags", [])
+                
+                # Buscar si ya existe la etiqueta por ID
+                for i, t in enumerate(tags):
+                    if t.get("id") == tag.id:
+                        # Actualizar la etiqueta existente
+                        tags[i] = tag.to_dict()
+                        break
+                else:
+                    # Si no se encontró, añadir la nueva etiqueta
+                    tags.append(tag.to_dict())
+                
+                data["tags"] = tags
+                write_json_file(TAGS_FILE, data)
             logger.info(f"Etiqueta '{tag.name}' guardada correctamente")
             return True
         except Exception as e:
             logger.error(f"Error al guardar etiqueta '{tag.name}': {e}")
             return False
+        finally:
+            Tag._invalidate_cache()
     
     @staticmethod
     def delete(tag_id: str) -> bool:
@@ -206,24 +276,64 @@ class Tag:
         Tag.ensure_file_exists()
         
         try:
-            data = read_json_file(TAGS_FILE)
-            tags = data.get("tags", [])
-            
-            # Filtrar la etiqueta a eliminar
-            new_tags = [t for t in tags if t.get("id") != tag_id]
-            
-            # Si no se eliminó ninguna etiqueta, retornar False
-            if len(new_tags) == len(tags):
-                logger.warning(f"No se encontró la etiqueta con ID '{tag_id}' para eliminar")
-                return False
-            
-            data["tags"] = new_tags
-            write_json_file(TAGS_FILE, data)
+            with _tags_file_lock():
+                # Comprobar la existencia en el índice en memoria antes de
+                # leer y reescribir el archivo completo
+                Tag._load_cache()
+                if tag_id not in _BY_ID:
+                    logger.warning(f"No se encontró la etiqueta con ID '{tag_id}' para eliminar")
+                    return False
+                
+                data = read_json_file(TAGS_FILE)
+                data["tags"] = [t for t in data.get("tags", []) if t.get("id") != tag_id]
+                write_json_file(TAGS_FILE, data)
             logger.info(f"Etiqueta con ID '{tag_id}' eliminada correctamente")
             return True
         except Exception as e:
             logger.error(f"Error al eliminar etiqueta con ID '{tag_id}': {e}")
             return False
+        finally:
+            Tag._invalidate_cache()
+    
+    @staticmethod
+    def _mutate_tags(fn) -> bool:
+        """
+        Lee el archivo de etiquetas una sola vez, aplica una modificación
+        y lo escribe una sola vez.
+        
+        Args:
+            fn: Función que recibe la lista de etiquetas (diccionarios) y la
+                modifica in situ. Si devuelve False no se escribe el archivo.
+            
+        Returns:
+            True si se aplicó y guardó la modificación, False en caso contrario
+        """
+        Tag.ensure_file_exists()
+        
+        try:
+            with _tags_file_lock():
+                data = read_json_file(TAGS_FILE)
+                tags = data.setdefault("tags", [])
+                
+                if fn(tags) is False:
+                    return False
+                
+                write_json_file(TAGS_FILE, data)
+            return True
+        except Exception as e:
+            logger.error(f"Error al actualizar el archivo de etiquetas: {e}")
+            return False
+        finally:
+            Tag._invalidate_cache()
+    
+    @staticmethod
+    def _find_by_name(tags: List[Dict[str, Any]], name: str) -> Optional[Dict[str, Any]]:
+        """Busca una etiqueta (diccionario) por nombre sin distinguir mayúsculas."""
+        name_lower = name.lower()
+        for t in tags:
+            if t.get("name", "").lower() == name_lower:
+                return t
+        return None
     
     @staticmethod
     def increment_post_count(tag_name: str) -> bool:
@@ -236,15 +346,15 @@ class Tag:
         Returns:
             True si se incrementó correctamente, False en caso contrario
         """
-        tag = Tag.get_by_name(tag_name)
-        if not tag:
-            # Si no existe, la creamos con contador 1
-            tag = Tag(name=tag_name, post_count=1)
-            return Tag.save(tag)
+        def _increment(tags):
+            t = Tag._find_by_name(tags, tag_name)
+            if t is None:
+                # Si no existe, la creamos con contador 1
+                tags.append(Tag(name=tag_name, post_count=1).to_dict())
+            else:
+                t["post_count"] = t.get("post_count", 0) + 1
         
-        # Si existe, incrementamos el contador
-        tag.post_count += 1
-        return Tag.save(tag)
+        return Tag._mutate_tags(_increment)
     
     @staticmethod
     def decrement_post_count(tag_name: str) -> bool:
@@ -257,14 +367,15 @@ class Tag:
         Returns:
             True si se decrementó correctamente, False en caso contrario
         """
-        tag = Tag.get_by_name(tag_name)
-        if not tag:
-            logger.warning(f"No se encontró la etiqueta '{tag_name}' para decrementar")
-            return False
+        def _decrement(tags):
+            t = Tag._find_by_name(tags, tag_name)
+            if t is None:
+                logger.warning(f"No se encontró la etiqueta '{tag_name}' para decrementar")
+                return False
+            # Decrementar el contador (mínimo 0)
+            t["post_count"] = max(0, t.get("post_count", 0) - 1)
         
-        # Decrementar el contador (mínimo 0)
-        tag.post_count = max(0, tag.post_count - 1)
-        return Tag.save(tag)
+        return Tag._mutate_tags(_decrement)
     
     @staticmethod
     def update_post_counts_from_posts() -> bool:
@@ -275,12 +386,11 @@ class Tag:
         Returns:
             True si se actualizaron correctamente, False en caso contrario
         """
+        Tag.ensure_file_exists()
+        
         try:
-            from utils.file_operations import read_json_file
-            from pathlib import Path
-            
             # Cargar los posts
-            posts_file = Path('data/posts.json')
+            posts_file = DATA_DIR / 'posts.json'
             if not posts_file.exists():
                 logger.warning("No se encontró el archivo de posts para actualizar contadores")
                 return False
@@ -288,35 +398,36 @@ class Tag:
             posts_data = read_json_file(posts_file)
             posts = posts_data.get("posts", [])
             
-            # Reiniciar todos los contadores
-            tags = Tag.get_all()
-            tag_counts = {tag.name.lower(): 0 for tag in tags}
-            
             # Contar posts por etiqueta
-            for post in posts:
-                post_tags = post.get("tags", [])
-                if isinstance(post_tags, list):
-                    for tag_name in post_tags:
-                        tag_name_lower = tag_name.lower()
-                        if tag_name_lower in tag_counts:
-                            tag_counts[tag_name_lower] += 1
-                        else:
-                            tag_counts[tag_name_lower] = 1
-            
-            # Actualizar etiquetas existentes y crear nuevas si es necesario
-            for tag_name, count in tag_counts.items():
-                tag = Tag.get_by_name(tag_name)
-                if tag:
-                    tag.post_count = count
-                    Tag.save(tag)
-                else:
-                    # Si la etiqueta no existe pero hay posts con ella, la creamos
-                    if count > 0:
-                        new_tag = Tag(name=tag_name, post_count=count)
-                        Tag.save(new_tag)
+            tag_counts = Counter(
+                tag_name.lower()
+                for post in posts
+                if isinstance(post_tags := post.get("tags", []), list)
+                for tag_name in post_tags
+            )
             
+            # Leer tags.json una sola vez, actualizar en memoria y escribir una sola vez
+            with _tags_file_lock():
+                data = read_json_file(TAGS_FILE)
+                tags_list = data.setdefault("tags", [])
+                existing = {t["name"].lower(): t for t in tags_list}
+                
+                # Reiniciar todos los contadores de las etiquetas existentes
+                for tag_name in existing:
+                    tag_counts.setdefault(tag_name, 0)
+
+                for tag_name, count in tag_counts.items():
+                    if tag_name in existing:
+                        existing[tag_name]["post_count"] = count
+                    elif count > 0:
+                        # Si la etiqueta no existe pero hay posts con ella, la creamos
+                        tags_list.append(Tag(name=tag_name, post_count=count).to_dict())
+
+                write_json_file(TAGS_FILE, data)
             logger.info("Contadores de etiquetas actualizados correctamente")
             return True
         except Exception as e:
             logger.error(f"Error al actualizar contadores de etiquetas: {e}")
-            return False 
\ No newline at end of file
+            return False
+        finally:
+            Tag._invalidate_cache() 
\ No newline at end of file
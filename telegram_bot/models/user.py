@@ -6,11 +6,99 @@ Modelo de datos para los usuarios
 """
 
 import logging
-from datetime import datetime
+import sqlite3
+import threading
+import time
 from database.connection import get_db
 
 logger = logging.getLogger(__name__)
 
+# Columnas de la tabla users que lee User.from_db_row
+USER_COLUMNS = "id, telegram_id, name, email, status, role, created_at"
+
+# Sentencias SQL reutilizadas (la misma cadena aprovecha la caché de sentencias de sqlite3)
+_SQL_INSERT_USER = "INSERT INTO users (telegram_id, name, email, status, role) VALUES (?, ?, ?, ?, ?)"
+_SQL_INSERT_USER_RETURNING = f"{_SQL_INSERT_USER} RETURNING {USER_COLUMNS}"
+_SQL_SELECT_BY_ID = f"SELECT {USER_COLUMNS} FROM users WHERE id = ?"
+_SQL_UPDATE_USER = "UPDATE users SET telegram_id = ?, name = ?, email = ?, status = ?, role = ? WHERE id = ?"
+_SQL_UPDATE_LAST_ACTIVE = "UPDATE users SET last_active = CURRENT_TIMESTAMP WHERE telegram_id = ?"
+_SQL_SELECT_BY_TELEGRAM_ID = f"SELECT {USER_COLUMNS} FROM users WHERE telegram_id = ?"
+_SQL_SELECT_BY_EMAIL = f"SELECT {USER_COLUMNS} FROM users WHERE email = ?"
+_SQL_SELECT_ALL = f"SELECT {USER_COLUMNS} FROM users"
+_SQL_SELECT_PAGE = f"SELECT {USER_COLUMNS} FROM users ORDER BY id LIMIT ? OFFSET ?"
+_SQL_SELECT_ROLE = "SELECT role FROM users WHERE telegram_id = ? LIMIT 1"
+_SQL_COUNT_ALL = "SELECT COUNT(*) as count FROM users"
+_SQL_COUNT_BY_STATUS = "SELECT COUNT(*) as count FROM users WHERE status = ?"
+_SQL_STATS = (
+    "SELECT COUNT(*) AS total, "
+    "COALESCE(SUM(CASE WHEN status = ? THEN 1 ELSE 0 END), 0) AS active, "
+    "COALESCE(SUM(CASE WHEN role = ? THEN 1 ELSE 0 END), 0) AS admins "
+    "FROM users"
+)
+
+# INSERT ... RETURNING solo está disponible a partir de SQLite 3.35.0
+_SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+def _insert_user(cur, params):
+    """
+    Insertar un usuario y devolver su fila completa.
+
+    Usa RETURNING si la versión de SQLite lo admite; si no, recupera la fila
+    con una consulta por el ID asignado.
+    """
+    if _SUPPORTS_RETURNING:
+        cur.execute(_SQL_INSERT_USER_RETURNING, params)
+        return cur.fetchone()
+    cur.execute(_SQL_INSERT_USER, params)
+    cur.execute(_SQL_SELECT_BY_ID, (cur.lastrowid,))
+    return cur.fetchone()
+
+# Caché en memoria con TTL para las búsquedas de usuario más frecuentes.
+# Guarda las filas de la base de datos (inmutables), no objetos User, para
+# que cada llamada reciba su propia instancia. Se guarda también None
+# (usuario inexistente) y se invalida al escribir.
+CACHE_TTL = 60
+CACHE_MAXSIZE = 1024
+_MISSING = object()
+_cache_by_telegram_id = {}
+_cache_by_email = {}
+# Las cachés se usan desde el bucle de eventos y desde hilos de asyncio.to_thread
+_cache_lock = threading.Lock()
+
+# Actividad de usuarios pendiente de escribir: se acumulan los telegram_id en
+# memoria, sin consultar la base de datos, y se vuelcan cada
+# LAST_ACTIVE_FLUSH_INTERVAL segundos con un único executemany
+# (ver User.flush_last_active)
+LAST_ACTIVE_FLUSH_INTERVAL = 30
+_pending_last_active = set()
+
+def _cache_get(cache, key):
+    """Obtener un valor de la caché o _MISSING si no está o ha caducado."""
+    with _cache_lock:
+        entry = cache.get(key)
+        if entry is None:
+            return _MISSING
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            cache.pop(key, None)
+            return _MISSING
+        return value
+
+def _cache_set(cache, key, value):
+    """Guardar un valor en la caché, descartando la entrada más antigua si está llena."""
+    with _cache_lock:
+        if key not in cache and len(cache) >= CACHE_MAXSIZE:
+            cache.pop(next(iter(cache)), None)
+        cache[key] = (value, time.monotonic() + CACHE_TTL)
+
+def _cache_evict(telegram_id=None, email=None):
+    """Eliminar de la caché las entradas de un usuario."""
+    with _cache_lock:
+        if telegram_id is not None:
+            _cache_by_telegram_id.pop(str(telegram_id), None)
+        if email is not None:
+            _cache_by_email.pop(email, None)
+
 class User:
     """Clase para manejar usuarios del bot."""
 
@@ -41,7 +129,11 @@ class User:
         self.email = email
         self.status = status
         self.role = role
-        self.created_at = created_at or datetime.now()
+        self.created_at = created_at
+        # Claves con las que el usuario está en caché, para invalidarlas
+        # aunque save() cambie el telegram_id o el email
+        self._orig_telegram_id = telegram_id
+        self._orig_email = email
 
     def to_dict(self):
         """Convertir el objeto a un diccionario."""
@@ -93,25 +185,19 @@ class User:
         """
         conn, cur = get_db()
         
+        # Invalidar posibles entradas negativas (usuario inexistente) en caché
+        _cache_evict(data.get("telegram_id"), data.get("email"))
+        
         try:
-            cur.execute('''
-                INSERT INTO users (telegram_id, name, email, status, role)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
+            user_data = _insert_user(cur, (
                 data.get("telegram_id"),
                 data.get("name"),
                 data.get("email"),
                 data.get("status", "pre_registered"),
                 data.get("role", "user")
             ))
-            
-            user_id = cur.lastrowid
             conn.commit()
             
-            # Obtener el usuario recién creado
-            cur.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-            user_data = cur.fetchone()
-            
             if user_data:
                 return cls.from_db_row(user_data)
             return None
@@ -126,9 +212,15 @@ class User:
         if not row:
             return None
             
-        # Convertir el objeto Row a diccionario
-        data = {key: row[key] for key in row.keys()}
-        return cls.from_dict(data)
+        return cls(
+            id=row['id'],
+            telegram_id=row['telegram_id'],
+            name=row['name'],
+            email=row['email'],
+            status=row['status'],
+            role=row['role'],
+            created_at=row['created_at']
+        )
 
     @classmethod
     def get_by_telegram_id(cls, telegram_id):
@@ -141,15 +233,19 @@ class User:
         Returns:
             User: Objeto de usuario o None si no existe.
         """
+        key = str(telegram_id)
+        cached = _cache_get(_cache_by_telegram_id, key)
+        if cached is not _MISSING:
+            return cls.from_db_row(cached)
+        
         conn, cur = get_db()
         
         try:
-            cur.execute('SELECT * FROM users WHERE telegram_id = ?', (telegram_id,))
+            cur.execute(_SQL_SELECT_BY_TELEGRAM_ID, (telegram_id,))
             user_data = cur.fetchone()
             
-            if user_data:
-                return cls.from_db_row(user_data)
-            return None
+            _cache_set(_cache_by_telegram_id, key, user_data)
+            return cls.from_db_row(user_data)
         except Exception as e:
             logger.error(f"Error al obtener usuario por telegram_id: {e}")
             return None
@@ -165,15 +261,18 @@ class User:
         Returns:
             User: Objeto de usuario o None si no existe.
         """
+        cached = _cache_get(_cache_by_email, email)
+        if cached is not _MISSING:
+            return cls.from_db_row(cached)
+        
         conn, cur = get_db()
         
         try:
-            cur.execute('SELECT * FROM users WHERE email = ?', (email,))
+            cur.execute(_SQL_SELECT_BY_EMAIL, (email,))
             user_data = cur.fetchone()
             
-            if user_data:
-                return cls.from_db_row(user_data)
-            return None
+            _cache_set(_cache_by_email, email, user_data)
+            return cls.from_db_row(user_data)
         except Exception as e:
             logger.error(f"Error al obtener usuario por email: {e}")
             return None
@@ -187,14 +286,15 @@ class User:
         """
         conn, cur = get_db()
         
+        # Invalidar la caché antes de escribir, tanto las claves originales
+        # como las nuevas (pueden tener una entrada negativa)
+        _cache_evict(self._orig_telegram_id, self._orig_email)
+        _cache_evict(self.telegram_id, self.email)
+        
         try:
             if self.id:
                 # Actualizar usuario existente
-                cur.execute('''
-                    UPDATE users
-                    SET telegram_id = ?, name = ?, email = ?, status = ?, role = ?
-                    WHERE id = ?
-                ''', (
+                cur.execute(_SQL_UPDATE_USER, (
                     self.telegram_id,
                     self.name,
                     self.email,
@@ -203,20 +303,24 @@ class User:
                     self.id
                 ))
             else:
-                # Insertar nuevo usuario
-                cur.execute('''
-                    INSERT INTO users (telegram_id, name, email, status, role)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (
+                # Insertar nuevo usuario; id y created_at se leen de la fila creada
+                row = _insert_user(cur, (
                     self.telegram_id,
                     self.name,
                     self.email,
                     self.status,
                     self.role
                 ))
-                self.id = cur.lastrowid
+                self.id = row['id']
+                self.created_at = row['created_at']
                 
             conn.commit()
+            # Volver a invalidar: otro hilo puede haber cacheado la fila
+            # anterior entre la primera invalidación y el commit
+            _cache_evict(self._orig_telegram_id, self._orig_email)
+            _cache_evict(self.telegram_id, self.email)
+            self._orig_telegram_id = self.telegram_id
+            self._orig_email = self.email
             return True
         except Exception as e:
             conn.rollback()
@@ -229,46 +333,96 @@ class User:
         return self.save()
 
     def update_last_active(self):
-        """Actualizar la fecha de última actividad del usuario."""
+        """Registrar la actividad del usuario (se escribe en el siguiente flush_last_active)."""
+        if self.telegram_id is None:
+            return False
+        
+        User.record_activity(self.telegram_id)
+        return True
+
+    @staticmethod
+    def record_activity(telegram_id):
+        """
+        Anotar la actividad de un usuario de Telegram sin acceder a la base de datos.
+
+        Si el usuario no está registrado, su UPDATE no afectará a ninguna fila.
+        """
+        _pending_last_active.add(str(telegram_id))
+
+    @classmethod
+    def flush_last_active(cls):
+        """
+        Escribir en la base de datos la actividad pendiente de todos los usuarios.
+
+        Returns:
+            bool: True si tuvo éxito, False en caso contrario.
+        """
+        global _pending_last_active
+        if not _pending_last_active:
+            return True
+        
+        telegram_ids, _pending_last_active = _pending_last_active, set()
+        if cls.bulk_update_last_active(telegram_ids):
+            return True
+        
+        # Conservar los IDs para reintentarlo en el siguiente volcado
+        _pending_last_active |= telegram_ids
+        return False
+
+    @classmethod
+    def bulk_update_last_active(cls, telegram_ids):
+        """
+        Actualizar la fecha de última actividad de varios usuarios en una sola transacción.
+
+        Args:
+            telegram_ids (iterable): IDs de Telegram de los usuarios.
+
+        Returns:
+            bool: True si tuvo éxito, False en caso contrario.
+        """
+        params = [(str(telegram_id),) for telegram_id in telegram_ids]
+        if not params:
+            return True
+        
         conn, cur = get_db()
         
         try:
-            cur.execute('''
-                UPDATE users 
-                SET last_active = CURRENT_TIMESTAMP
-                WHERE id = ?
-            ''', (self.id,))
-            
+            cur.executemany(_SQL_UPDATE_LAST_ACTIVE, params)
             conn.commit()
             return True
         except Exception as e:
             conn.rollback()
-            logger.error(f"Error al actualizar última actividad del usuario: {e}")
+            logger.error(f"Error al actualizar última actividad de {len(params)} usuarios: {e}")
             return False
 
     @staticmethod
     def get_all():
         """Obtiene todos los usuarios registrados."""
         conn, cur = get_db()
-        cur.execute("SELECT * FROM users")
-        rows = cur.fetchall()
-        users = []
-        for row in rows:
-            user = User()
-            user.id = row['id']
-            user.telegram_id = row['telegram_id']
-            user.name = row['name']
-            user.email = row['email']
-            user.status = row['status']
-            user.role = row['role']
-            users.append(user)
-        return users
+        cur.execute(_SQL_SELECT_ALL)
+        return [User.from_db_row(row) for row in cur.fetchall()]
+
+    @staticmethod
+    def get_page(limit=10, offset=0):
+        """
+        Obtiene una página de usuarios sin cargar la tabla completa.
+
+        Args:
+            limit (int): Número máximo de usuarios a devolver.
+            offset (int): Número de usuarios a saltar.
+
+        Returns:
+            list: Lista de objetos User.
+        """
+        conn, cur = get_db()
+        cur.execute(_SQL_SELECT_PAGE, (limit, offset))
+        return [User.from_db_row(row) for row in cur.fetchall()]
 
     @staticmethod
     def count_all():
         """Cuenta el número total de usuarios registrados."""
         conn, cur = get_db()
-        cur.execute("SELECT COUNT(*) as count FROM users")
+        cur.execute(_SQL_COUNT_ALL)
         result = cur.fetchone()
         return result['count'] if result else 0
 
@@ -276,12 +430,33 @@ class User:
     def count_active():
         """Cuenta el número de usuarios activos."""
         conn, cur = get_db()
-        cur.execute("SELECT COUNT(*) as count FROM users WHERE status = ?", (User.STATUS_ACTIVE,))
+        cur.execute(_SQL_COUNT_BY_STATUS, (User.STATUS_ACTIVE,))
         result = cur.fetchone()
         return result['count'] if result else 0
 
+    @staticmethod
+    def get_stats():
+        """
+        Obtiene en una sola consulta el total de usuarios, los activos y los administradores.
+
+        Returns:
+            dict: Diccionario con las claves total, active y admins.
+        """
+        conn, cur = get_db()
+        cur.execute(_SQL_STATS, (User.STATUS_ACTIVE, User.ROLE_ADMIN))
+        result = cur.fetchone()
+        if not result:
+            return {"total": 0, "active": 0, "admins": 0}
+        return {"total": result['total'], "active": result['active'], "admins": result['admins']}
+
     @staticmethod
     def is_admin(telegram_id):
-        """Verifica si un usuario es administrador."""
-        user = User.get_by_telegram_id(telegram_id)
-        return user and user.role == User.ROLE_ADMIN 
\ No newline at end of file
+        """Verifica si un usuario es administrador consultando solo su rol."""
+        cached = _cache_get(_cache_by_telegram_id, str(telegram_id))
+        if cached is not _MISSING:
+            return cached is not None and cached['role'] == User.ROLE_ADMIN
+        
+        conn, cur = get_db()
+        cur.execute(_SQL_SELECT_ROLE, (telegram_id,))
+        row = cur.fetchone()
+        return row is not None and row['role'] == User.ROLE_ADMIN 
\ No newline at end of file
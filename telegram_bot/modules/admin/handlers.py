@@ -5,7 +5,9 @@ Este archivo contiene los manejadores para las funcionalidades administrativas,
 incluyendo gestión de usuarios, estadísticas y configuración global.
 """
 
+import asyncio
 import logging
+import time
 from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ParseMode
@@ -23,44 +25,98 @@ ADMIN_WAITING_ROLE = 2
 ADMIN_WAITING_STATUS = 3
 ADMIN_WAITING_CONFIRM = 4
 
+# Teclados y textos fijos del panel (los objetos de PTB son inmutables y se pueden reutilizar)
+_ADMIN_PANEL_MARKUP = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("👥 Gestión Usuarios", callback_data="admin:users"),
+        InlineKeyboardButton("📊 Estadísticas", callback_data="admin:stats")
+    ],
+    [
+        InlineKeyboardButton("⚙️ Configuración", callback_data="admin:config"),
+        InlineKeyboardButton("« Menú Principal", callback_data="menu:main")
+    ]
+])
+_USERS_PANEL_MARKUP = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("➕ Nuevo Usuario", callback_data="admin:user_new"),
+        InlineKeyboardButton("📋 Listar Usuarios", callback_data="admin:user_list")
+    ],
+    [
+        InlineKeyboardButton("🔄 Cambiar Rol", callback_data="admin:user_role"),
+        InlineKeyboardButton("❌ Bloquear Usuario", callback_data="admin:user_block")
+    ],
+    [
+        InlineKeyboardButton("« Volver", callback_data="admin:panel")
+    ]
+])
+_BACK_USERS_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("« Volver", callback_data="admin:users")]])
+_BACK_PANEL_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("« Volver", callback_data="admin:panel")]])
+_MAIN_MENU_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("« Menú Principal", callback_data="menu:main")]])
+
+_ADMIN_PANEL_TEXT = (
+    "🔐 <b>PANEL DE ADMINISTRACIÓN</b>\n\n"
+    "Bienvenido al panel de administración. Desde aquí puedes:\n"
+    "• Gestionar usuarios (añadir, bloquear, cambiar roles)\n"
+    "• Ver estadísticas del sistema\n"
+    "• Configurar parámetros globales"
+)
+_USERS_PANEL_TEXT = (
+    "👥 <b>GESTIÓN DE USUARIOS</b>\n\n"
+    "Selecciona una acción para gestionar los usuarios del sistema:"
+)
+_NO_ADMIN_TEXT = "⛔ No tienes permisos de administrador para acceder a esta función."
+
+# Etiquetas para mostrar el rol y el estado de los usuarios
+ROLE_LABEL = {"admin": "👑 Admin", "user": "👤 Usuario"}
+DEFAULT_ROLE_LABEL = "👤 Usuario"
+STATUS_LABEL = {"active": "✅ Activo"}
+DEFAULT_STATUS_LABEL = "❌ Inactivo"
+
+def _format_user_row(u):
+    """Formatea una línea del listado de usuarios."""
+    return (
+        f"• {u.name} (@{u.telegram_id}) - {ROLE_LABEL.get(u.role, DEFAULT_ROLE_LABEL)} - "
+        f"{STATUS_LABEL.get(u.status, DEFAULT_STATUS_LABEL)}"
+    )
+
+# Segundos durante los que se reutiliza la comprobación de administrador guardada en user_data
+ADMIN_CHECK_TTL = 300
+
+def _remember_admin(context: ContextTypes.DEFAULT_TYPE):
+    """Guarda en user_data que el usuario ya ha sido verificado como administrador."""
+    context.user_data['is_admin'] = True
+    context.user_data['admin_checked_at'] = time.monotonic()
+
+def _is_admin_cached(context: ContextTypes.DEFAULT_TYPE):
+    """Indica si hay una verificación de administrador reciente en user_data."""
+    return (
+        context.user_data.get('is_admin', False)
+        and time.monotonic() - context.user_data.get('admin_checked_at', 0) < ADMIN_CHECK_TTL
+    )
+
 async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Maneja el comando /admin."""
     user = update.effective_user
     logger.info(f"Usuario {user.id} ha solicitado acceso al panel de administración")
     
     # Verificar si el usuario es administrador
-    db_user = User.get_by_telegram_id(user.id)
+    db_user = await asyncio.to_thread(User.get_by_telegram_id, user.id)
     if not db_user or db_user.role != "admin":
         await update.message.reply_text(
-            "⛔ No tienes permisos de administrador para acceder a esta función.",
+            _NO_ADMIN_TEXT,
             parse_mode=ParseMode.HTML
         )
         return
     
+    _remember_admin(context)
+    
     # Mostrar el panel de administración
     await send_admin_panel(update, context)
 
 async def send_admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE, is_new_message=True):
     """Envía el panel de administración."""
-    keyboard = [
-        [
-            InlineKeyboardButton("👥 Gestión Usuarios", callback_data="admin:users"),
-            InlineKeyboardButton("📊 Estadísticas", callback_data="admin:stats")
-        ],
-        [
-            InlineKeyboardButton("⚙️ Configuración", callback_data="admin:config"),
-            InlineKeyboardButton("« Menú Principal", callback_data="menu:main")
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    text = (
-        "🔐 <b>PANEL DE ADMINISTRACIÓN</b>\n\n"
-        "Bienvenido al panel de administración. Desde aquí puedes:\n"
-        "• Gestionar usuarios (añadir, bloquear, cambiar roles)\n"
-        "• Ver estadísticas del sistema\n"
-        "• Configurar parámetros globales"
-    )
+    reply_markup = _ADMIN_PANEL_MARKUP
+    text = _ADMIN_PANEL_TEXT
     
     if is_new_message and hasattr(update, 'message'):
         await update.message.reply_text(text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
@@ -73,39 +129,22 @@ async def send_admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE, i
 
 async def admin_users_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Muestra el panel de gestión de usuarios."""
-    keyboard = [
-        [
-            InlineKeyboardButton("➕ Nuevo Usuario", callback_data="admin:user_new"),
-            InlineKeyboardButton("📋 Listar Usuarios", callback_data="admin:user_list")
-        ],
-        [
-            InlineKeyboardButton("🔄 Cambiar Rol", callback_data="admin:user_role"),
-            InlineKeyboardButton("❌ Bloquear Usuario", callback_data="admin:user_block")
-        ],
-        [
-            InlineKeyboardButton("« Volver", callback_data="admin:panel")
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await update.callback_query.edit_message_text(
-        text="👥 <b>GESTIÓN DE USUARIOS</b>\n\n"
-             "Selecciona una acción para gestionar los usuarios del sistema:",
-        reply_markup=reply_markup,
+        text=_USERS_PANEL_TEXT,
+        reply_markup=_USERS_PANEL_MARKUP,
         parse_mode=ParseMode.HTML
     )
 
 async def list_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Lista los usuarios registrados en el sistema."""
-    users = User.get_all()
+    # Solo se cargan los usuarios que se muestran (limitado a 10 para no sobrepasar límites de Telegram)
+    users = await asyncio.to_thread(User.get_page, 10, 0)
     
     if not users:
         await update.callback_query.edit_message_text(
             text="👥 <b>LISTADO DE USUARIOS</b>\n\n"
                  "No hay usuarios registrados en el sistema.",
-            reply_markup=InlineKeyboardMarkup([[
-                InlineKeyboardButton("« Volver", callback_data="admin:users")
-            ]]),
+            reply_markup=_BACK_USERS_MARKUP,
             parse_mode=ParseMode.HTML
         )
         return
@@ -113,39 +152,37 @@ async def list_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Añadir cabecera para el listado
     header = "<b>NOMBRE</b>   <b>ID</b>   <b>ROL</b>   <b>ESTADO</b>"
     
-    # Crear texto con información de usuarios (limitado a 10 para no sobrepasar límites de Telegram)
-    user_info = []
-    for u in users[:10]:
-        role = "👑 Admin" if u.role == "admin" else "👤 Usuario"
-        status = "Activo" if u.status == "active" else "Inactivo"
-        status_emoji = "✅" if u.status == "active" else "❌"
-        user_info.append(f"• {u.name} (@{u.telegram_id}) - {role} - {status_emoji} {status}")
+    total = await asyncio.to_thread(User.count_all)
     
-    user_text = "\n".join(user_info)
+    # Crear texto con información de usuarios
+    user_text = "\n".join(map(_format_user_row, users))
     
     await update.callback_query.edit_message_text(
         text=f"👥 <b>LISTADO DE USUARIOS</b>\n\n"
              f"{header}\n"
              f"────────────────────\n"
              f"{user_text}\n\n"
-             f"Mostrando {min(10, len(users))} de {len(users)} usuarios.",
-        reply_markup=InlineKeyboardMarkup([[
-            InlineKeyboardButton("« Volver", callback_data="admin:users")
-        ]]),
+             f"Mostrando {len(users)} de {total} usuarios.",
+        reply_markup=_BACK_USERS_MARKUP,
         parse_mode=ParseMode.HTML
     )
 
-async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Muestra estadísticas del sistema."""
-    # Contar usuarios
-    total_users = User.count_all()
-    active_users = User.count_active()
-    admin_users = sum(1 for u in User.get_all() if u.role == "admin")
-    
-    # Obtener estadísticas de contenido
+def _count_sftp_configs():
+    """Cuenta las configuraciones SFTP guardadas."""
     conn, cur = get_db()
     cur.execute("SELECT COUNT(*) as count FROM user_config WHERE key LIKE 'sftp_%'")
-    sftp_configs = cur.fetchone()['count'] // 4  # Aproximadamente 4 campos por configuración
+    return cur.fetchone()['count'] // 4  # Aproximadamente 4 campos por configuración
+
+async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Muestra estadísticas del sistema."""
+    # Las consultas de usuarios y de contenido son independientes: se lanzan a la vez
+    user_stats, sftp_configs = await asyncio.gather(
+        asyncio.to_thread(User.get_stats),
+        asyncio.to_thread(_count_sftp_configs)
+    )
+    total_users = user_stats["total"]
+    active_users = user_stats["active"]
+    admin_users = user_stats["admins"]
     
     await update.callback_query.edit_message_text(
         text="📊 <b>ESTADÍSTICAS DEL SISTEMA</b>\n\n"
@@ -158,9 +195,7 @@ async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
              f"<b>Fecha del servidor:</b>\n"
              f"• {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}\n\n"
              f"Esta pantalla se ampliará con más estadísticas en próximas versiones.",
-        reply_markup=InlineKeyboardMarkup([[
-            InlineKeyboardButton("« Volver", callback_data="admin:panel")
-        ]]),
+        reply_markup=_BACK_PANEL_MARKUP,
         parse_mode=ParseMode.HTML
     )
 
@@ -172,77 +207,84 @@ async def admin_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
     data = query.data.split(':')
     action = data[1] if len(data) > 1 else None
     
-    # Verificar que el usuario es admin
-    user = User.get_by_telegram_id(update.effective_user.id)
-    if not user or user.role != "admin":
-        await query.edit_message_text(
-            "⛔ No tienes permisos de administrador para acceder a esta función.",
-            reply_markup=InlineKeyboardMarkup([[
-                InlineKeyboardButton("« Menú Principal", callback_data="menu:main")
-            ]])
-        )
-        return
+    # Verificar que el usuario es admin (solo se consulta la BD si no hay una verificación reciente)
+    if not _is_admin_cached(context):
+        user = await asyncio.to_thread(User.get_by_telegram_id, update.effective_user.id)
+        if not user or user.role != "admin":
+            context.user_data.pop('is_admin', None)
+            await query.edit_message_text(
+                _NO_ADMIN_TEXT,
+                reply_markup=_MAIN_MENU_MARKUP
+            )
+            return
+        _remember_admin(context)
     
     # Procesar la acción
-    if action == "panel":
-        await send_admin_panel(update, context, is_new_message=False)
-    elif action == "users":
-        await admin_users_panel(update, context)
-    elif action == "stats":
-        await show_stats(update, context)
-    elif action == "user_list":
-        await list_users(update, context)
-    elif action == "user_new":
-        # Implementación pendiente
-        await query.edit_message_text(
-            "👤 <b>AÑADIR NUEVO USUARIO</b>\n\n"
-            "Esta función te permitirá pre-registrar nuevos usuarios en el sistema.\n\n"
-            "Estamos implementando esta función. ¡Estará disponible pronto!",
-            reply_markup=InlineKeyboardMarkup([[
-                InlineKeyboardButton("« Volver", callback_data="admin:users")
-            ]]),
-            parse_mode=ParseMode.HTML
-        )
-    elif action == "user_role":
-        # Implementación pendiente
-        await query.edit_message_text(
-            "👤 <b>CAMBIAR ROL DE USUARIO</b>\n\n"
-            "Esta función te permitirá cambiar el rol de los usuarios entre normal y administrador.\n\n"
-            "Estamos implementando esta función. ¡Estará disponible pronto!",
-            reply_markup=InlineKeyboardMarkup([[
-                InlineKeyboardButton("« Volver", callback_data="admin:users")
-            ]]),
-            parse_mode=ParseMode.HTML
-        )
-    elif action == "user_block":
-        # Implementación pendiente
-        await query.edit_message_text(
-            "👤 <b>BLOQUEAR USUARIO</b>\n\n"
-            "Esta función te permitirá bloquear o desbloquear usuarios.\n\n"
-            "Estamos implementando esta función. ¡Estará disponible pronto!",
-            reply_markup=InlineKeyboardMarkup([[
-                InlineKeyboardButton("« Volver", callback_data="admin:users")
-            ]]),
-            parse_mode=ParseMode.HTML
-        )
-    elif action == "config":
-        # Implementación pendiente
-        await query.edit_message_text(
-            "⚙️ <b>CONFIGURACIÓN GLOBAL</b>\n\n"
-            "Esta función te permitirá configurar parámetros globales del sistema.\n\n"
-            "Estamos implementando esta función. ¡Estará disponible pronto!",
-            reply_markup=InlineKeyboardMarkup([[
-                InlineKeyboardButton("« Volver", callback_data="admin:panel")
-            ]]),
-            parse_mode=ParseMode.HTML
-        )
-    else:
-        await query.edit_message_text(
-            "⚠️ Acción no reconocida. Por favor, intenta nuevamente.",
-            reply_markup=InlineKeyboardMarkup([[
-                InlineKeyboardButton("« Volver", callback_data="admin:panel")
-            ]])
-        )
+    handler = _ADMIN_ACTIONS.get(action, _unknown_action)
+    await handler(update, context)
+
+async def _show_admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Vuelve a mostrar el panel de administración editando el mensaje."""
+    await send_admin_panel(update, context, is_new_message=False)
+
+async def _pending_user_new(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Implementación pendiente: pre-registro de usuarios."""
+    await update.callback_query.edit_message_text(
+        "👤 <b>AÑADIR NUEVO USUARIO</b>\n\n"
+        "Esta función te permitirá pre-registrar nuevos usuarios en el sistema.\n\n"
+        "Estamos implementando esta función. ¡Estará disponible pronto!",
+        reply_markup=_BACK_USERS_MARKUP,
+        parse_mode=ParseMode.HTML
+    )
+
+async def _pending_user_role(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Implementación pendiente: cambio de rol."""
+    await update.callback_query.edit_message_text(
+        "👤 <b>CAMBIAR ROL DE USUARIO</b>\n\n"
+        "Esta función te permitirá cambiar el rol de los usuarios entre normal y administrador.\n\n"
+        "Estamos implementando esta función. ¡Estará disponible pronto!",
+        reply_markup=_BACK_USERS_MARKUP,
+        parse_mode=ParseMode.HTML
+    )
+
+async def _pending_user_block(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Implementación pendiente: bloqueo de usuarios."""
+    await update.callback_query.edit_message_text(
+        "👤 <b>BLOQUEAR USUARIO</b>\n\n"
+        "Esta función te permitirá bloquear o desbloquear usuarios.\n\n"
+        "Estamos implementando esta función. ¡Estará disponible pronto!",
+        reply_markup=_BACK_USERS_MARKUP,
+        parse_mode=ParseMode.HTML
+    )
+
+async def _pending_config(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Implementación pendiente: configuración global."""
+    await update.callback_query.edit_message_text(
+        "⚙️ <b>CONFIGURACIÓN GLOBAL</b>\n\n"
+        "Esta función te permitirá configurar parámetros globales del sistema.\n\n"
+        "Estamos implementando esta función. ¡Estará disponible pronto!",
+        reply_markup=_BACK_PANEL_MARKUP,
+        parse_mode=ParseMode.HTML
+    )
+
+async def _unknown_action(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Responde a una acción de administración no reconocida."""
+    await update.callback_query.edit_message_text(
+        "⚠️ Acción no reconocida. Por favor, intenta nuevamente.",
+        reply_markup=_BACK_PANEL_MARKUP
+    )
+
+# Tabla de acciones del callback admin:<acción>
+_ADMIN_ACTIONS = {
+    "panel": _show_admin_panel,
+    "users": admin_users_panel,
+    "stats": show_stats,
+    "user_list": list_users,
+    "user_new": _pending_user_new,
+    "user_role": _pending_user_role,
+    "user_block": _pending_user_block,
+    "config": _pending_config,
+}
 
 def setup_admin_handlers(application):
     """Configura los manejadores para el módulo de administración."""
@@ -2,10 +2,12 @@
 Manejadores para la autenticación y el registro de usuarios.
 """
 
+import asyncio
 import logging
 import re
+import time
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler, MessageHandler
+from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler, MessageHandler, filters
 from telegram.constants import ParseMode
 
 # Importar desde nuestro módulo de compatibilidad
@@ -17,23 +19,59 @@ logger = logging.getLogger(__name__)
 # Importar modelos y estados
 from models.user import User
 from core.states import State, state_manager
+from core.handlers import send_main_menu
+
+# Expresión regular para validar emails (compilada una sola vez)
+EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+EMAIL_MAX_LENGTH = 254
+
+# Códigos de autorización válidos (por ahora fijos para pruebas)
+VALID_AUTH_CODES = frozenset({"12345678", "87654321", "11223344"})
+
+# Mensaje inicial del registro
+REGISTER_WELCOME_TEMPLATE = (
+    "👤 <b>Registro de Usuario</b>\n\n"
+    "Bienvenido al proceso de registro, {first_name}.\n\n"
+    "Para continuar, necesito tu código de autorización. "
+    "Este código debería haberte sido proporcionado por el administrador del bot.\n\n"
+    "Por favor, envíame el código a continuación."
+)
+
+# Segundos tras los que se descarta un registro abandonado
+REGISTRATION_TTL = 30 * 60
+
+class InRegistrationFilter(filters.MessageFilter):
+    """Filtro que solo acepta mensajes de usuarios que están en proceso de registro."""
+    
+    def filter(self, message):
+        if message.from_user is None:
+            return False
+        conversation = state_manager.find_conversation(message.from_user.id)
+        return conversation is not None and conversation.state == State.REGISTERING
+
+def _is_valid_email(email):
+    """Valida un email descartando primero los casos obvios sin ejecutar la expresión regular."""
+    if len(email) > EMAIL_MAX_LENGTH or '@' not in email:
+        return False
+    if '.' not in email.rsplit('@', 1)[-1]:
+        return False
+    return EMAIL_RE.match(email) is not None
 
 async def register_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Manejador para el comando /register."""
     user = update.effective_user
     chat_id = update.effective_chat.id
 
-    logger.info(f"Usuario {user.id} inició el proceso de registro")
+    logger.info("Usuario %s inició el proceso de registro", user.id)
 
     # Verificar si el usuario ya está registrado
-    existing_user = User.get_by_telegram_id(user.id)
+    existing_user = await asyncio.to_thread(User.get_by_telegram_id, user.id)
     
     if existing_user:
-        logger.info(f"Usuario {user.id} encontrado en la base de datos con estado: {existing_user.status}")
+        logger.info("Usuario %s encontrado en la base de datos con estado: %s", user.id, existing_user.status)
         
     if existing_user and existing_user.is_active():
         # En lugar de solo informar, mostrar el menú principal
-        from core.handlers import send_main_menu
         await context.bot.send_message(
             chat_id=chat_id,
             text=f"Ya estás registrado en el sistema como {existing_user.name} ({existing_user.email}). Accediendo al menú principal."
@@ -41,44 +79,36 @@ async def register_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await send_main_menu(update, context)
         return
 
-    # Cambiar el estado a REGISTERING
-    state_manager.set_state(user.id, State.REGISTERING)
-    
-    # Marcar que el logo ya fue enviado para evitar enviarlo nuevamente en otros mensajes
-    state_manager.set_data(user.id, "logo_sent", True)
+    # Cambiar el estado a REGISTERING, marcar que el logo ya fue enviado para evitar
+    # enviarlo nuevamente en otros mensajes y guardar el paso actual (una sola escritura)
+    state_manager.set_data_many(
+        user.id,
+        {"logo_sent": True, "register_step": "waiting_auth_code", "register_started_at": time.time()},
+        state=State.REGISTERING
+    )
 
     # NO enviamos el logo en el proceso de registro
     # El logo ya se muestra en el mensaje de bienvenida
 
     await context.bot.send_message(
         chat_id=chat_id,
-        text=(
-            f"👤 <b>Registro de Usuario</b>\n\n"
-            f"Bienvenido al proceso de registro, {user.first_name}.\n\n"
-            f"Para continuar, necesito tu código de autorización. "
-            f"Este código debería haberte sido proporcionado por el administrador del bot.\n\n"
-            f"Por favor, envíame el código a continuación."
-        ),
+        text=REGISTER_WELCOME_TEMPLATE.format(first_name=user.first_name),
         parse_mode=ParseMode.HTML
     )
 
-    # Guardamos el paso actual en el estado
-    state_manager.set_data(user.id, "register_step", "waiting_auth_code")
-
-async def process_auth_code(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def process_auth_code(update: Update, context: ContextTypes.DEFAULT_TYPE, *, text=None):
     """Procesa el código de autorización enviado por el usuario."""
     user = update.effective_user
     chat_id = update.effective_chat.id
-    auth_code = update.message.text.strip()
+    auth_code = text if text is not None else update.message.text.strip()
 
-    logger.info(f"Usuario {user.id} envió código de autorización: {auth_code}")
+    logger.info("Usuario %s envió código de autorización: %s", user.id, auth_code)
 
     # Verificar el código en la base de datos
-    # Por ahora, aceptamos "12345678" como código válido para pruebas
-    valid_codes = ["12345678", "87654321", "11223344"]
-    if auth_code in valid_codes:
-        # Guardar el código de autorización en el estado (no borramos otros datos aquí)
-        state_manager.set_data(user.id, "auth_code", auth_code)
+    # Por ahora, aceptamos los códigos de VALID_AUTH_CODES para pruebas
+    if auth_code in VALID_AUTH_CODES:
+        # Guardar el código de autorización y el paso actual en el estado (no borramos otros datos aquí)
+        state_manager.set_data_many(user.id, {"auth_code": auth_code, "register_step": "waiting_name"})
         
         # Código válido, continuar con el registro
         await context.bot.send_message(
@@ -89,9 +119,6 @@ async def process_auth_code(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "Por favor, introduce tu nombre completo:"
             )
         )
-
-        # Actualizar el paso actual en el estado
-        state_manager.set_data(user.id, "register_step", "waiting_name")
     else:
         # Código inválido
         await context.bot.send_message(
@@ -102,25 +129,25 @@ async def process_auth_code(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
         )
 
-async def process_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def process_name(update: Update, context: ContextTypes.DEFAULT_TYPE, *, text=None):
     """Procesa el nombre enviado por el usuario."""
     user = update.effective_user
     chat_id = update.effective_chat.id
-    name = update.message.text.strip()
+    name = text if text is not None else update.message.text.strip()
 
     # Evitar confundir el código de autorización con el nombre
     auth_code = state_manager.get_data(user.id, "auth_code", "")
     if name == auth_code:
         # Si el nombre es igual al código de autorización, es probable que sea un error
         # Es posible que el sistema haya recibido el mismo mensaje dos veces
-        logger.warning(f"Usuario {user.id} envió un nombre igual al código de autorización")
+        logger.warning("Usuario %s envió un nombre igual al código de autorización", user.id)
         await context.bot.send_message(
             chat_id=chat_id,
             text="Por favor, introduce tu nombre:"
         )
         return
 
-    logger.info(f"Usuario {user.id} envió nombre: {name}")
+    logger.info("Usuario %s envió nombre: %s", user.id, name)
 
     # Validar el nombre
     if len(name) < 3:
@@ -130,8 +157,8 @@ async def process_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    # Guardar el nombre en el estado
-    state_manager.set_data(user.id, "name", name)
+    # Guardar el nombre y el paso actual en el estado
+    state_manager.set_data_many(user.id, {"name": name, "register_step": "waiting_email"})
 
     # Solicitar el email
     await context.bot.send_message(
@@ -142,20 +169,16 @@ async def process_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
     )
 
-    # Actualizar el paso actual en el estado
-    state_manager.set_data(user.id, "register_step", "waiting_email")
-
-async def process_email(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def process_email(update: Update, context: ContextTypes.DEFAULT_TYPE, *, text=None):
     """Procesa el email enviado por el usuario."""
     user = update.effective_user
     chat_id = update.effective_chat.id
-    email = update.message.text.strip()
+    email = text if text is not None else update.message.text.strip()
 
-    logger.info(f"Usuario {user.id} envió email: {email}")
+    logger.info("Usuario %s envió email: %s", user.id, email)
 
     # Validar el email
-    email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    if not re.match(email_pattern, email):
+    if not _is_valid_email(email):
         await context.bot.send_message(
             chat_id=chat_id,
             text="El email no es válido. Por favor, introduce una dirección de email válida:"
@@ -163,7 +186,7 @@ async def process_email(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Verificar si el email ya está registrado
-    existing_user = User.get_by_email(email)
+    existing_user = await asyncio.to_thread(User.get_by_email, email)
     if existing_user:
         await context.bot.send_message(
             chat_id=chat_id,
@@ -174,8 +197,8 @@ async def process_email(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    # Guardar el email en el estado
-    state_manager.set_data(user.id, "email", email)
+    # Guardar el email y el paso actual en el estado
+    state_manager.set_data_many(user.id, {"email": email, "register_step": "waiting_confirmation"})
 
     # Obtener los datos guardados
     user_data = state_manager.get_conversation(user.id).data
@@ -203,9 +226,6 @@ async def process_email(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode=ParseMode.HTML
     )
 
-    # Actualizar el paso actual en el estado
-    state_manager.set_data(user.id, "register_step", "waiting_confirmation")
-
 async def register_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Procesa los callbacks del proceso de registro."""
     query = update.callback_query
@@ -215,10 +235,9 @@ async def register_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     # Formato esperado: register:acción
-    callback_data = query.data.split(':')
-    action = callback_data[1] if len(callback_data) > 1 else ""
+    _, _, action = query.data.partition(':')
 
-    logger.info(f"Usuario {user.id} seleccionó {action} en el registro")
+    logger.info("Usuario %s seleccionó %s en el registro", user.id, action)
 
     if action == "confirm":
         # Obtener los datos guardados
@@ -226,17 +245,18 @@ async def register_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         name = user_data.get("name", "")
         email = user_data.get("email", "")
 
-        logger.info(f"Datos de registro para usuario {user.id}: nombre={name}, email={email}")
+        logger.info("Datos de registro para usuario %s: nombre=%s, email=%s", user.id, name, email)
 
         # Verificar si el usuario ya existe
-        existing_user = User.get_by_telegram_id(user.id)
+        existing_user = await asyncio.to_thread(User.get_by_telegram_id, user.id)
         if existing_user:
             # Si ya existe, actualizarlo
             existing_user.name = name
             existing_user.email = email
             existing_user.status = "active"
-            success = existing_user.save()
-            logger.info(f"Usuario existente {user.id} actualizado con estado='active'")
+            success = await asyncio.to_thread(existing_user.save)
+            db_user = existing_user
+            logger.info("Usuario existente %s actualizado con estado='active'", user.id)
         else:
             # Crear el usuario en la base de datos
             new_user = User(
@@ -246,37 +266,26 @@ async def register_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 status="active",
                 role="user"
             )
-            success = new_user.save()
-            logger.info(f"Nuevo usuario {user.id} creado con estado='active'")
+            success = await asyncio.to_thread(new_user.save)
+            db_user = new_user
+            logger.info("Nuevo usuario %s creado con estado='active'", user.id)
 
         if success:
             # Limpiar el estado
             state_manager.set_state(user.id, State.IDLE)
             
-            # Verificar que el usuario se registró correctamente
-            db_user = User.get_by_telegram_id(user.id)
-            
+            # El objeto guardado ya refleja el estado persistido, no hace falta releerlo
             if db_user and db_user.is_active():
-                logger.info(f"Usuario {user.id} verificado en la base de datos como activo: estado={db_user.status}")
+                logger.info("Usuario %s verificado en la base de datos como activo: estado=%s", user.id, db_user.status)
                 
-                # Mensaje de confirmación
-                await query.edit_message_text(
-                    text=(
-                        "✅ <b>¡Registro Completado!</b>\n\n"
-                        f"Bienvenido, {name}. Tu cuenta ha sido creada correctamente."
-                    ),
-                    parse_mode=ParseMode.HTML
+                # Mostrar la confirmación y el menú principal en una sola edición del mensaje
+                context.user_data["custom_greeting"] = (
+                    "✅ <b>¡Registro Completado!</b>\n\n"
+                    f"Bienvenido, {name}. Tu cuenta ha sido creada correctamente."
                 )
-                
-                # Esperar un segundo para que el usuario pueda leer el mensaje
-                import asyncio
-                await asyncio.sleep(1)
-                
-                # Mostrar el menú principal
-                from core.handlers import send_main_menu
-                await send_main_menu(update, context)
+                await send_main_menu(update, context, is_new_message=False)
             else:
-                logger.error(f"Error: Usuario {user.id} no se activó correctamente. Estado actual: {db_user.status if db_user else 'No encontrado'}")
+                logger.error("Error: Usuario %s no se activó correctamente. Estado actual: %s", user.id, db_user.status if db_user else 'No encontrado')
                 await query.edit_message_text(
                     text=(
                         "⚠️ <b>Registro Incompleto</b>\n\n"
@@ -286,7 +295,7 @@ async def register_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     parse_mode=ParseMode.HTML
                 )
         else:
-            logger.error(f"Error al guardar el usuario {user.id} en la base de datos")
+            logger.error("Error al guardar el usuario %s en la base de datos", user.id)
             await query.edit_message_text(
                 text=(
                     "❌ <b>Error en el Registro</b>\n\n"
@@ -309,52 +318,59 @@ async def register_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def auth_message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Manejador global para mensajes relacionados con autenticación."""
     user = update.effective_user
-    message_text = update.message.text.strip()
+    
+    # Leer la conversación una sola vez; el estado y los datos se consultan sobre ella.
+    # Este manejador recibe todos los mensajes de texto: no se crea una conversación
+    # para usuarios que no la tienen, simplemente se ignora el mensaje.
+    conversation = state_manager.find_conversation(user.id)
     
     # Verificar si el usuario está en algún estado de registro
-    state = state_manager.get_state(user.id)
-    if state != State.REGISTERING:
+    if conversation is None or conversation.state != State.REGISTERING:
         # No está en proceso de registro, ignorar
         return
     
+    message_text = update.message.text.strip()
+    
+    # Descartar registros abandonados para que su estado no se acumule
+    started_at = conversation.get_data("register_started_at")
+    if started_at and time.time() - started_at > REGISTRATION_TTL:
+        logger.info("Registro caducado para usuario %s, eliminando su estado", user.id)
+        state_manager.reset_user(user.id)
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text="⌛ El proceso de registro ha caducado. Usa /register para empezar de nuevo."
+        )
+        return
+    
     # Evitar el procesamiento duplicado verificando si el mensaje ya ha sido procesado
     # Agregamos una marca temporal para evitar procesamiento duplicado
     message_id = update.message.message_id
-    last_processed = state_manager.get_data(user.id, "last_processed_message_id", 0)
-    
-    if message_id <= last_processed:
+    if not state_manager.mark_processed_if_new(user.id, message_id):
         # Este mensaje ya ha sido procesado, ignorarlo
-        logger.debug(f"Mensaje {message_id} ya procesado, ignorando")
+        logger.debug("Mensaje %s ya procesado, ignorando", message_id)
         return
     
-    # Marcar este mensaje como procesado
-    state_manager.set_data(user.id, "last_processed_message_id", message_id)
-    
     # Obtener el paso actual del registro
-    register_step = state_manager.get_data(user.id, "register_step", "")
+    register_step = conversation.get_data("register_step", "")
     
-    logger.info(f"Usuario {user.id} en paso {register_step} envió: {message_text}")
+    # Cada paso registra su propio mensaje a nivel INFO; aquí basta con DEBUG
+    logger.debug("Usuario %s en paso %s envió: %s", user.id, register_step, message_text)
     
     # Procesar según el paso actual
-    if register_step == "waiting_auth_code":
-        # En lugar de limpiar todos los datos, solo actualizamos el paso actual
-        await process_auth_code(update, context)
-    elif register_step == "waiting_name":
-        # Verificar que no estamos utilizando el código de autorización como nombre
-        auth_code = state_manager.get_data(user.id, "auth_code", "")
-        if message_text == auth_code:
-            # Si el usuario envía nuevamente el código de autorización como nombre
-            await context.bot.send_message(
-                chat_id=update.effective_chat.id,
-                text="Por favor, introduce tu nombre:"
-            )
-            return
-        await process_name(update, context)
-    elif register_step == "waiting_email":
-        await process_email(update, context)
-    else:
+    handler = STEP_HANDLERS.get(register_step)
+    if handler is None:
         # Paso no reconocido, ignorar
-        logger.warning(f"Paso de registro no reconocido para usuario {user.id}: {register_step}")
+        logger.warning("Paso de registro no reconocido para usuario %s: %s", user.id, register_step)
+        return
+    
+    await handler(update, context, text=message_text)
+
+# Manejador de cada paso del registro
+STEP_HANDLERS = {
+    "waiting_auth_code": process_auth_code,
+    "waiting_name": process_name,
+    "waiting_email": process_email,
+}
 
 def setup_auth_handlers(application):
     """Configurar los manejadores de autenticación."""
@@ -365,7 +381,12 @@ def setup_auth_handlers(application):
     application.add_handler(CallbackQueryHandler(register_callback, pattern="^register:"))
     
     # Manejador de mensajes para el proceso de registro (mayor prioridad que otros manejadores)
-    # Usando grupo -1 para asegurar que se procese antes que todos los demás manejadores
-    application.add_handler(MessageHandler(Filters.TEXT & ~Filters.COMMAND, auth_message_handler), group=-1)
+    # Usando grupo -1 para asegurar que se procese antes que todos los demás manejadores.
+    # InRegistrationFilter descarta en el propio filtro los mensajes de usuarios que no se
+    # están registrando, así PTB no llega a crear el contexto ni a lanzar el manejador.
+    application.add_handler(
+        MessageHandler(Filters.TEXT & ~Filters.COMMAND & InRegistrationFilter(), auth_message_handler),
+        group=-1
+    )
     
     logger.info("Manejadores de autenticación configurados correctamente") 
\ No newline at end of file
@@ -7,7 +7,10 @@ incluyendo creación, edición, visualización y eliminación de categorías.
 
 import json
 import os
+import re
 import logging
+from collections import Counter
+from operator import itemgetter
 from pathlib import Path
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ConversationHandler, CommandHandler, CallbackQueryHandler, MessageHandler
@@ -20,6 +23,10 @@ from utils.file_operations import read_json_file, write_json_file
 # Estados para la conversación
 SELECTING_ACTION, SELECT_CATEGORY, CREATING_CATEGORY, ENTER_CATEGORY_NAME, ENTER_CATEGORY_COLOR = range(5)
 
+# Formato de color hexadecimal (#RGB o #RRGGBB). Con la expresión ya compilada,
+# validar un color de 4 o 7 caracteres cuesta lo mismo que comprobarlo a mano.
+HEX_COLOR_RE = re.compile(r'^#(?:[0-9a-fA-F]{3}){1,2}$')
+
 # Paths
 DATA_DIR = Path('data')
 CATEGORIES_FILE = DATA_DIR / 'categories.json'
@@ -31,7 +38,71 @@ DATA_DIR.mkdir(exist_ok=True)
 # Logger
 logger = logging.getLogger(__name__)
 
+# Teclados estáticos, construidos una sola vez
+_CATEGORIES_MENU_MARKUP = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("🔍 Ver Categorías", callback_data="view_categories"),
+        InlineKeyboardButton("➕ Nueva Categoría", callback_data="new_category")
+    ],
+    [
+        InlineKeyboardButton("✏️ Editar Categoría", callback_data="edit_category"),
+        InlineKeyboardButton("🗑️ Eliminar Categoría", callback_data="delete_category")
+    ],
+    [InlineKeyboardButton("🔙 Volver al Menú", callback_data="back_to_main")]
+])
+_EDIT_OPTIONS_MARKUP = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("📝 Cambiar Nombre", callback_data="change_name"),
+        InlineKeyboardButton("🎨 Cambiar Color", callback_data="change_color")
+    ],
+    [InlineKeyboardButton("🔙 Volver", callback_data="back_to_edit_select")]
+])
+_BACK_BUTTON = InlineKeyboardButton("🔙 Volver", callback_data="back_to_categories")
+_BACK_MARKUP = InlineKeyboardMarkup([[_BACK_BUTTON]])
+_BACK_TO_CATEGORIES_MARKUP = InlineKeyboardMarkup(
+    [[InlineKeyboardButton("🔙 Volver a Categorías", callback_data="back_to_categories")]]
+)
+
+# Cachés en memoria de los archivos JSON, invalidadas por mtime del archivo.
+# "index" guarda un índice derivado de "data" y se reconstruye al refrescarla.
+# Se comparten entre todas las conversaciones: una copia por usuario en
+# context.user_data no vería los cambios hechos por otro administrador a mitad
+# de flujo, y la comprobación de nombres duplicados necesita datos frescos.
+_categories_cache = {"mtime": 0, "data": None, "index": None}
+_posts_cache = {"mtime": 0, "data": None, "index": None}
+
 # Funciones de utilidad
+def _read_json_cached(file_path, cache):
+    """Lee un archivo JSON reutilizando el contenido en caché si el archivo no ha cambiado."""
+    mtime = file_path.stat().st_mtime_ns
+    if cache["data"] is not None and mtime == cache["mtime"]:
+        return cache["data"]
+    
+    data = read_json_file(file_path)
+    cache["data"] = data
+    cache["mtime"] = mtime
+    cache["index"] = None
+    return data
+
+def _write_json_cached(file_path, cache, data):
+    """
+    Escribe un archivo JSON y deja en caché los datos escritos.
+    
+    write_json_file ya escribe de forma atómica (archivo temporal + os.replace)
+    y serializa con orjson si está disponible, así que la caché nunca lee un
+    archivo a medio escribir.
+    """
+    try:
+        write_json_file(file_path, data)
+    except Exception:
+        # Los datos en caché pueden haberse modificado antes de fallar la escritura
+        cache["data"] = None
+        cache["index"] = None
+        raise
+    cache["data"] = data
+    cache["mtime"] = file_path.stat().st_mtime_ns
+    cache["index"] = None
+
 def load_categories():
     """Carga las categorías del archivo JSON."""
     if not CATEGORIES_FILE.exists():
@@ -43,76 +114,108 @@ def load_categories():
                 {"name": "Negocios", "color": "#DC3545"}
             ]
         }
-        write_json_file(CATEGORIES_FILE, default_data)
+        _write_json_cached(CATEGORIES_FILE, _categories_cache, default_data)
         return default_data
-    return read_json_file(CATEGORIES_FILE)
+    
+    categories_data = _read_json_cached(CATEGORIES_FILE, _categories_cache)
+    # Garantizar que la lista siempre exista para poder indexarla directamente
+    categories_data.setdefault("categories", [])
+    return categories_data
+
+def get_categories():
+    """Devuelve la lista de categorías cargadas."""
+    return load_categories()["categories"]
 
 def save_categories(categories_data):
     """Guarda las categorías en el archivo JSON."""
-    write_json_file(CATEGORIES_FILE, categories_data)
+    _write_json_cached(CATEGORIES_FILE, _categories_cache, categories_data)
+
+def load_category_index():
+    """
+    Devuelve un índice {nombre en minúsculas: [posiciones]} de las categorías cargadas.
+    Guarda una lista porque puede haber categorías que solo difieren en mayúsculas.
+    """
+    categories_data = load_categories()
+    if _categories_cache["index"] is None:
+        index = {}
+        for i, category in enumerate(categories_data["categories"]):
+            index.setdefault(category["name"].lower(), []).append(i)
+        _categories_cache["index"] = index
+    return _categories_cache["index"]
+
+def find_category_index(categories, category_name):
+    """Devuelve la posición de la categoría con ese nombre exacto o None si no existe."""
+    for i in load_category_index().get(category_name.lower(), ()):
+        if i < len(categories) and categories[i]["name"] == category_name:
+            return i
+    return None
+
+def load_posts():
+    """Carga los posts del archivo JSON (lanza FileNotFoundError si no existe)."""
+    return _read_json_cached(POSTS_FILE, _posts_cache)
+
+def load_post_counts():
+    """Devuelve un Counter {categoría: número de posts}, recalculado solo si posts.json cambia."""
+    posts_data = load_posts()
+    if _posts_cache["index"] is None:
+        posts = posts_data.get("posts", [])
+        try:
+            # map + itemgetter recorre los posts sin un frame de Python por elemento
+            _posts_cache["index"] = Counter(map(itemgetter("category"), posts))
+        except KeyError:
+            # Algún post no tiene categoría
+            _posts_cache["index"] = Counter(post.get("category") for post in posts)
+    return _posts_cache["index"]
+
+def save_posts(posts_data):
+    """Guarda los posts en el archivo JSON."""
+    _write_json_cached(POSTS_FILE, _posts_cache, posts_data)
 
 # Handlers
 async def start_categories(update: Update, context: CallbackContext) -> int:
     """Inicia el flujo de gestión de categorías."""
-    keyboard = [
-        [
-            InlineKeyboardButton("🔍 Ver Categorías", callback_data="view_categories"),
-            InlineKeyboardButton("➕ Nueva Categoría", callback_data="new_category")
-        ],
-        [
-            InlineKeyboardButton("✏️ Editar Categoría", callback_data="edit_category"),
-            InlineKeyboardButton("🗑️ Eliminar Categoría", callback_data="delete_category")
-        ],
-        [InlineKeyboardButton("🔙 Volver al Menú", callback_data="back_to_main")]
-    ]
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
     await update.callback_query.answer()
     await update.callback_query.message.edit_text(
         "🏷️ *Gestión de Categorías*\n\n"
         "Puedes ver, crear, editar o eliminar categorías para tus posts.\n\n"
         "Selecciona una opción:",
-        reply_markup=reply_markup,
+        reply_markup=_CATEGORIES_MENU_MARKUP,
         parse_mode='Markdown'
     )
     return SELECTING_ACTION
 
 async def view_categories(update: Update, context: CallbackContext) -> int:
     """Muestra la lista de categorías existentes."""
-    categories_data = load_categories()
-    categories = categories_data.get("categories", [])
+    categories = get_categories()
     
     # Intentar cargar posts para contar cuántos hay por categoría
     try:
-        posts_data = read_json_file(POSTS_FILE)
-        posts = posts_data.get("posts", [])
+        post_counts = load_post_counts()
     except (FileNotFoundError, json.JSONDecodeError):
-        posts = []
+        post_counts = Counter()
     
-    message = "📋 *Categorías Disponibles*\n\n"
+    parts = ["📋 *Categorías Disponibles*\n\n"]
     
     if not categories:
-        message += "No hay categorías definidas."
+        parts.append("No hay categorías definidas.")
     else:
         # Añadir cabecera para el listado
-        message += "*NOMBRE*   *COLOR*   *POSTS*\n"
-        message += "─────────────────────\n\n"
+        parts.append("*NOMBRE*   *COLOR*   *POSTS*\n")
+        parts.append("─────────────────────\n\n")
         
-        for i, category in enumerate(categories, 1):
-            # Contar posts en esta categoría
-            post_count = sum(1 for post in posts if post.get("category") == category["name"])
-            
-            message += f"{i}. *{category['name']}*\n"
-            message += f"   🎨 Color: {category['color']}\n"
-            message += f"   📝 Posts: {post_count}\n\n"
+        parts.extend(
+            f"{i}. *{category['name']}*\n"
+            f"   🎨 Color: {category['color']}\n"
+            f"   📝 Posts: {post_counts[category['name']]}\n\n"
+            for i, category in enumerate(categories, 1)
+        )
     
-    keyboard = [[InlineKeyboardButton("🔙 Volver", callback_data="back_to_categories")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    message = "".join(parts)
     
     await update.callback_query.answer()
     await update.callback_query.message.edit_text(
         message,
-        reply_markup=reply_markup,
+        reply_markup=_BACK_MARKUP,
         parse_mode='Markdown'
     )
     return SELECTING_ACTION
@@ -139,10 +242,7 @@ async def enter_category_name(update: Update, context: CallbackContext) -> int:
         return ENTER_CATEGORY_NAME
     
     # Validar que no exista ya una categoría con ese nombre
-    categories_data = load_categories()
-    categories = categories_data.get("categories", [])
-    
-    if any(category["name"].lower() == category_name.lower() for category in categories):
+    if category_name.lower() in load_category_index():
         await update.message.reply_text(
             "⚠️ Ya existe una categoría con ese nombre. Por favor, elige otro nombre."
         )
@@ -165,8 +265,7 @@ async def enter_category_color(update: Update, context: CallbackContext) -> int:
     category_color = update.message.text.strip()
     
     # Validar el formato del color (hexadecimal)
-    import re
-    if not re.match(r'^#(?:[0-9a-fA-F]{3}){1,2}$', category_color):
+    if not HEX_COLOR_RE.match(category_color):
         await update.message.reply_text(
             "⚠️ El color debe estar en formato hexadecimal (ejemplo: #FF0000). Por favor, intenta de nuevo."
         )
@@ -177,53 +276,39 @@ async def enter_category_color(update: Update, context: CallbackContext) -> int:
     
     # Guardar la nueva categoría
     categories_data = load_categories()
-    categories = categories_data.get("categories", [])
-    categories.append({"name": category_name, "color": category_color})
-    categories_data["categories"] = categories
+    categories_data["categories"].append({"name": category_name, "color": category_color})
     save_categories(categories_data)
     
     # Limpiar datos de usuario
-    if "new_category_name" in context.user_data:
-        del context.user_data["new_category_name"]
+    context.user_data.pop("new_category_name", None)
     
     # Mostrar mensaje de confirmación
-    keyboard = [[InlineKeyboardButton("🔙 Volver a Categorías", callback_data="back_to_categories")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await update.message.reply_text(
         f"✅ ¡Categoría *{category_name}* creada exitosamente!\n\n"
         f"🎨 Color: {category_color}",
-        reply_markup=reply_markup,
+        reply_markup=_BACK_TO_CATEGORIES_MARKUP,
         parse_mode='Markdown'
     )
     return SELECTING_ACTION
 
 async def select_category_to_edit(update: Update, context: CallbackContext) -> int:
     """Muestra la lista de categorías para seleccionar una a editar."""
-    categories_data = load_categories()
-    categories = categories_data.get("categories", [])
+    categories = get_categories()
     
     if not categories:
-        keyboard = [[InlineKeyboardButton("🔙 Volver", callback_data="back_to_categories")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
         await update.callback_query.answer()
         await update.callback_query.message.edit_text(
             "❌ No hay categorías para editar.",
-            reply_markup=reply_markup
+            reply_markup=_BACK_MARKUP
         )
         return SELECTING_ACTION
     
-    keyboard = []
-    for category in categories:
-        keyboard.append([
-            InlineKeyboardButton(
-                f"{category['name']} ({category['color']})",
-                callback_data=f"edit_{category['name']}"
-            )
-        ])
+    keyboard = [
+        [InlineKeyboardButton(f"{category['name']} ({category['color']})", callback_data=f"edit_{category['name']}")]
+        for category in categories
+    ]
     
-    keyboard.append([InlineKeyboardButton("🔙 Volver", callback_data="back_to_categories")])
+    keyboard.append([_BACK_BUTTON])
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     await update.callback_query.answer()
@@ -237,22 +322,14 @@ async def select_category_to_edit(update: Update, context: CallbackContext) -> i
 
 async def edit_category(update: Update, context: CallbackContext) -> int:
     """Muestra opciones para editar una categoría específica."""
-    category_name = update.callback_query.data.split("_")[1]
+    data = update.callback_query.data
+    category_name = data[len("edit_"):] if data.startswith("edit_") else data
     context.user_data["edit_category"] = category_name
     
-    keyboard = [
-        [
-            InlineKeyboardButton("📝 Cambiar Nombre", callback_data="change_name"),
-            InlineKeyboardButton("🎨 Cambiar Color", callback_data="change_color")
-        ],
-        [InlineKeyboardButton("🔙 Volver", callback_data="back_to_edit_select")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     # Buscar la categoría para mostrar sus datos actuales
-    categories_data = load_categories()
-    categories = categories_data.get("categories", [])
-    category = next((c for c in categories if c["name"] == category_name), None)
+    categories = get_categories()
+    i = find_category_index(categories, category_name)
+    category = categories[i] if i is not None else None
     
     if not category:
         await update.callback_query.answer("Categoría no encontrada")
@@ -265,7 +342,7 @@ async def edit_category(update: Update, context: CallbackContext) -> int:
         f"- Nombre: {category['name']}\n"
         f"- Color: {category['color']}\n\n"
         f"¿Qué deseas modificar?",
-        reply_markup=reply_markup,
+        reply_markup=_EDIT_OPTIONS_MARKUP,
         parse_mode='Markdown'
     )
     return SELECT_CATEGORY
@@ -290,9 +367,8 @@ async def change_category_color(update: Update, context: CallbackContext) -> int
     category_name = context.user_data.get("edit_category")
     
     # Buscar el color actual
-    categories_data = load_categories()
-    categories = categories_data.get("categories", [])
-    category = next((c for c in categories if c["name"] == category_name), None)
+    categories = get_categories()
+    category = categories[find_category_index(categories, category_name)]
     
     await update.callback_query.answer()
     await update.callback_query.message.edit_text(
@@ -315,12 +391,13 @@ async def update_category_field(update: Update, context: CallbackContext) -> int
     new_value = update.message.text.strip()
     
     categories_data = load_categories()
-    categories = categories_data.get("categories", [])
+    categories = categories_data["categories"]
     
     # Validaciones según el campo a editar
     if edit_action == "name":
         # Verificar que no exista otra categoría con ese nombre
-        if any(c["name"].lower() == new_value.lower() and c["name"] != category_name for c in categories):
+        if any(categories[i]["name"] != category_name
+               for i in load_category_index().get(new_value.lower(), ())):
             await update.message.reply_text(
                 "⚠️ Ya existe otra categoría con ese nombre. Por favor, elige un nombre diferente."
             )
@@ -329,8 +406,7 @@ async def update_category_field(update: Update, context: CallbackContext) -> int
         field_name = "nombre"
     elif edit_action == "color":
         # Validar formato de color hexadecimal
-        import re
-        if not re.match(r'^#(?:[0-9a-fA-F]{3}){1,2}$', new_value):
+        if not HEX_COLOR_RE.match(new_value):
             await update.message.reply_text(
                 "⚠️ El color debe estar en formato hexadecimal (ejemplo: #FF0000). Por favor, intenta de nuevo."
             )
@@ -342,69 +418,57 @@ async def update_category_field(update: Update, context: CallbackContext) -> int
         return SELECTING_ACTION
     
     # Actualizar la categoría
-    for category in categories:
-        if category["name"] == category_name:
-            # Si estamos actualizando el nombre, también actualizar la categoría en los posts
-            if edit_action == "name":
-                try:
-                    posts_data = read_json_file(POSTS_FILE)
-                    posts = posts_data.get("posts", [])
-                    for post in posts:
+    i = find_category_index(categories, category_name)
+    if i is not None:
+        category = categories[i]
+        # Si estamos actualizando el nombre, también actualizar la categoría en los posts
+        if edit_action == "name":
+            try:
+                # Solo reescribir posts.json si algún post usa esta categoría
+                if load_post_counts()[category_name]:
+                    posts_data = load_posts()
+                    for post in posts_data.get("posts", []):
                         if post.get("category") == category_name:
                             post["category"] = new_value
-                    write_json_file(POSTS_FILE, posts_data)
-                except Exception as e:
-                    logger.error(f"Error al actualizar categoría en posts: {e}")
-                
-                category["name"] = new_value
-            else:  # Estamos actualizando el color
-                category["color"] = new_value
-            break
+                    save_posts(posts_data)
+            except Exception as e:
+                logger.error(f"Error al actualizar categoría en posts: {e}")
+            
+            category["name"] = new_value
+        else:  # Estamos actualizando el color
+            category["color"] = new_value
     
     save_categories(categories_data)
     
     # Limpiar datos de usuario
-    if "edit_category" in context.user_data:
-        del context.user_data["edit_category"]
-    if "edit_action" in context.user_data:
-        del context.user_data["edit_action"]
+    context.user_data.pop("edit_category", None)
+    context.user_data.pop("edit_action", None)
     
     # Mostrar mensaje de confirmación
-    keyboard = [[InlineKeyboardButton("🔙 Volver a Categorías", callback_data="back_to_categories")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await update.message.reply_text(
         f"✅ ¡{field_name.capitalize()} de categoría actualizado exitosamente!",
-        reply_markup=reply_markup
+        reply_markup=_BACK_TO_CATEGORIES_MARKUP
     )
     return SELECTING_ACTION
 
 async def select_category_to_delete(update: Update, context: CallbackContext) -> int:
     """Muestra la lista de categorías para seleccionar una a eliminar."""
-    categories_data = load_categories()
-    categories = categories_data.get("categories", [])
+    categories = get_categories()
     
     if not categories:
-        keyboard = [[InlineKeyboardButton("🔙 Volver", callback_data="back_to_categories")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
         await update.callback_query.answer()
         await update.callback_query.message.edit_text(
             "❌ No hay categorías para eliminar.",
-            reply_markup=reply_markup
+            reply_markup=_BACK_MARKUP
         )
         return SELECTING_ACTION
     
-    keyboard = []
-    for category in categories:
-        keyboard.append([
-            InlineKeyboardButton(
-                f"🗑️ {category['name']}",
-                callback_data=f"delete_{category['name']}"
-            )
-        ])
+    keyboard = [
+        [InlineKeyboardButton(f"🗑️ {category['name']}", callback_data=f"delete_{category['name']}")]
+        for category in categories
+    ]
     
-    keyboard.append([InlineKeyboardButton("🔙 Volver", callback_data="back_to_categories")])
+    keyboard.append([_BACK_BUTTON])
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     await update.callback_query.answer()
@@ -419,13 +483,14 @@ async def select_category_to_delete(update: Update, context: CallbackContext) ->
 
 async def delete_category(update: Update, context: CallbackContext) -> int:
     """Elimina una categoría y actualiza los posts asociados."""
-    category_name = update.callback_query.data.split("_")[1]
+    data = update.callback_query.data
+    category_name = data[len("delete_"):] if data.startswith("delete_") else data
     
     categories_data = load_categories()
-    categories = categories_data.get("categories", [])
+    categories = categories_data["categories"]
     
     # Verificar si la categoría existe
-    if not any(c["name"] == category_name for c in categories):
+    if find_category_index(categories, category_name) is None:
         await update.callback_query.answer("Categoría no encontrada")
         return await select_category_to_delete(update, context)
     
@@ -435,28 +500,24 @@ async def delete_category(update: Update, context: CallbackContext) -> int:
     
     # Actualizar los posts que tenían esta categoría
     try:
-        posts_data = read_json_file(POSTS_FILE)
-        posts = posts_data.get("posts", [])
-        updated_count = 0
-        
-        for post in posts:
-            if post.get("category") == category_name:
-                post["category"] = "Sin categoría"
-                updated_count += 1
+        # Solo reescribir posts.json si algún post usa esta categoría
+        updated_count = load_post_counts()[category_name]
+        if updated_count:
+            posts_data = load_posts()
+            for post in posts_data.get("posts", []):
+                if post.get("category") == category_name:
+                    post["category"] = "Sin categoría"
+            save_posts(posts_data)
         
-        write_json_file(POSTS_FILE, posts_data)
         category_update_msg = f"\n\n✅ {updated_count} posts actualizados a 'Sin categoría'."
     except Exception as e:
         logger.error(f"Error al actualizar posts: {e}")
         category_update_msg = "\n\n⚠️ No se pudieron actualizar los posts asociados."
     
-    keyboard = [[InlineKeyboardButton("🔙 Volver a Categorías", callback_data="back_to_categories")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await update.callback_query.answer()
     await update.callback_query.message.edit_text(
         f"✅ Categoría *{category_name}* eliminada exitosamente.{category_update_msg}",
-        reply_markup=reply_markup,
+        reply_markup=_BACK_TO_CATEGORIES_MARKUP,
         parse_mode='Markdown'
     )
     return SELECTING_ACTION
@@ -2,10 +2,13 @@
 Manejadores para la gestión de contenido web.
 """
 
+import asyncio
+import html
 import logging
 import uuid
-import json
 import os
+import re
+import time
 from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler, MessageHandler
@@ -17,6 +20,14 @@ import models.user
 # Importar desde nuestro módulo de compatibilidad
 from utils.compat import Filters, CallbackContext
 
+from utils.file_operations import read_json_file
+
+# La subida por SFTP es opcional (depende de paramiko)
+try:
+    from ..sftp.handlers import upload_post_to_sftp
+except ImportError:
+    upload_post_to_sftp = None
+
 # Configuración de logging
 logger = logging.getLogger(__name__)
 
@@ -26,6 +37,146 @@ POSTS_TEMPLATE = os.path.join(TEMPLATES_DIR, 'posts.json')
 CATEGORIES_TEMPLATE = os.path.join(TEMPLATES_DIR, 'categories.json')
 TAGS_TEMPLATE = os.path.join(TEMPLATES_DIR, 'tags.json')
 
+# Longitudes máximas de los datos enviados por el usuario
+TITLE_MAX_LENGTH = 150
+MAX_CONTENT_LENGTH = 200_000
+
+# Al recibir contenido se confirma el primer fragmento y después uno de cada
+# CONTENT_ACK_EVERY, o cualquiera que llegue tras CONTENT_ACK_INTERVAL segundos
+# sin confirmación (un texto largo pegado llega en muchos mensajes seguidos)
+CONTENT_ACK_EVERY = 5
+CONTENT_ACK_INTERVAL = 2.0
+
+# Prefijos aceptados para URLs enviadas por el usuario
+URL_PREFIXES = ("http://", "https://")
+
+# Generación de slugs: primero se quitan los acentos y después todo lo que no
+# sea alfanumérico o espacio, y los espacios se convierten en guiones
+SLUG_ACCENTS = str.maketrans('áéíóúñ', 'aeioun')
+SLUG_STRIP_RE = re.compile(r'[^a-z0-9\s]')
+SLUG_SPACES_RE = re.compile(r'\s+')
+
+# Mensaje de resumen mostrado antes de publicar un post
+SUMMARY_TEMPLATE = (
+    "<b>📋 Resumen del Post</b>\n\n"
+    "<b>Título:</b> {title}\n"
+    "<b>Descripción:</b> {description}\n"
+    "<b>URL:</b> {url}\n"
+    "<b>Imagen:</b> {image}\n"
+    "<b>Categoría:</b> {category}\n"
+    "<b>Slug:</b> {slug}\n\n"
+    "¿Deseas publicar este artículo?"
+)
+
+# Claves del estado con los datos del post en curso
+POST_DATA_KEYS = ("post_title", "post_description", "post_url", "post_image", "post_category", "post_slug")
+
+# Categorías usadas si no se puede leer la plantilla
+DEFAULT_CATEGORIES = [
+    {"id": "desarrollo", "name": "Desarrollo"},
+    {"id": "salud", "name": "Salud"},
+    {"id": "alimentacion", "name": "Alimentación"},
+    {"id": "crianza", "name": "Crianza"},
+    {"id": "embarazo", "name": "Embarazo"},
+    {"id": "pareja", "name": "Pareja"}
+]
+
+# Caché en memoria de las plantillas JSON, invalidada por mtime del archivo.
+# "index" guarda datos derivados de "data" y se reconstruye al refrescarla.
+_template_cache = {}
+
+def _load_template(path):
+    """Lee una plantilla JSON reutilizando el contenido en caché si el archivo no ha cambiado."""
+    mtime = os.stat(path).st_mtime_ns
+    entry = _template_cache.get(path)
+    if entry is not None and entry["mtime"] == mtime:
+        return entry
+    
+    entry = {"mtime": mtime, "data": read_json_file(path), "index": None}
+    _template_cache[path] = entry
+    return entry
+
+async def _load_template_async(path):
+    """
+    Como _load_template, pero si la plantilla no está en caché o ha cambiado
+    la lee en un hilo aparte para no bloquear el bucle de eventos.
+    
+    Devuelve None si la plantilla no se puede leer.
+    """
+    try:
+        entry = _template_cache.get(path)
+        if entry is not None and entry["mtime"] == os.stat(path).st_mtime_ns:
+            return entry
+        return await asyncio.to_thread(_load_template, path)
+    except Exception:
+        logger.warning(f"No se pudo leer la plantilla {path}", exc_info=True)
+        return None
+
+# Categorías por defecto con su índice {id: nombre}, en el formato de _load_categories
+_DEFAULT_CATEGORIES_INDEX = (DEFAULT_CATEGORIES, {cat['id']: cat['name'] for cat in DEFAULT_CATEGORIES})
+
+async def _load_categories():
+    """
+    Devuelve la lista de categorías de la plantilla y un índice {id: nombre}.
+    
+    Si la plantilla no se puede leer se devuelven las categorías por defecto.
+    """
+    entry = await _load_template_async(CATEGORIES_TEMPLATE)
+    if entry is None:
+        return _DEFAULT_CATEGORIES_INDEX
+    
+    try:
+        if entry["index"] is None:
+            categories = entry["data"]['categories']
+            entry["index"] = (categories, {cat['id']: cat['name'] for cat in categories})
+        return entry["index"]
+    except Exception as e:
+        logger.error(f"Error al cargar las categorías: {e}")
+        return _DEFAULT_CATEGORIES_INDEX
+
+def _load_template_posts_by_id(entry):
+    """Devuelve los posts de ejemplo de la entrada de plantilla indexados por ID."""
+    if entry["index"] is None:
+        entry["index"] = {post.get('id'): post for post in entry["data"].get("posts", [])}
+    return entry["index"]
+
+def _html(value):
+    """Escapa un dato del usuario para mostrarlo en un mensaje con ParseMode.HTML."""
+    return html.escape(str(value), quote=False)
+
+def _user_posts_index(user_id, user_posts):
+    """Devuelve el índice {id: posición} de los posts del usuario, reconstruyéndolo si no está al día."""
+    index = state_manager.get_data(user_id, "user_posts_index")
+    if index is None or len(index) != len(user_posts):
+        index = {post.get('id'): i for i, post in enumerate(user_posts)}
+        state_manager.set_data(user_id, "user_posts_index", index)
+    return index
+
+def _get_content_buffer(user_id):
+    """
+    Devuelve el buffer de contenido como lista de fragmentos (None si no existe).
+    Los estados guardados antes de usar una lista lo tienen como texto: se convierte.
+    """
+    content_buffer = state_manager.get_data(user_id, "content_buffer")
+    if isinstance(content_buffer, str):
+        content_buffer = [content_buffer.rstrip("\n")] if content_buffer.strip() else []
+        state_manager.set_data(user_id, "content_buffer", content_buffer)
+    return content_buffer
+
+# Teclado de categorías y la lista a partir de la que se construyó
+_category_markup_cache = {"source": None, "markup": None}
+
+def _category_markup(categories):
+    """Devuelve el teclado de categorías (dos por fila), reconstruido solo si cambia la lista."""
+    if _category_markup_cache["source"] is not categories:
+        rows = [categories[i:i + 2] for i in range(0, len(categories), 2)]
+        _category_markup_cache["markup"] = InlineKeyboardMarkup([
+            [InlineKeyboardButton(cat['name'], callback_data=f"content:category:{cat['id']}") for cat in row]
+            for row in rows
+        ])
+        _category_markup_cache["source"] = categories
+    return _category_markup_cache["markup"]
+
 async def newpost_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Manejador para el comando /newpost."""
     user = update.effective_user
@@ -68,23 +219,20 @@ async def process_title(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     
+    if len(title) > TITLE_MAX_LENGTH:
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text=f"⚠️ El título es demasiado largo. Debe tener como máximo {TITLE_MAX_LENGTH} caracteres. Inténtalo de nuevo:"
+        )
+        return
+    
     # Guardar el título
     state_manager.set_data(user.id, "post_title", title)
     
     # Generar un slug a partir del título
-    slug = title.lower()
-    # Eliminar caracteres especiales y espacios
-    import re
-    slug = re.sub(r'[^a-z0-9áéíóúñ\s]', '', slug)
-    # Reemplazar acentos
-    replacements = {
-        'á': 'a', 'é': 'e', 'í': 'i', 'ó': 'o', 'ú': 'u',
-        'ñ': 'n'
-    }
-    for a, b in replacements.items():
-        slug = slug.replace(a, b)
-    # Reemplazar espacios por guiones
-    slug = re.sub(r'\s+', '-', slug)
+    slug = title.lower().translate(SLUG_ACCENTS)
+    slug = SLUG_STRIP_RE.sub('', slug)
+    slug = SLUG_SPACES_RE.sub('-', slug)
     
     state_manager.set_data(user.id, "post_slug", slug)
     
@@ -159,13 +307,13 @@ async def process_url_or_content(update: Update, context: ContextTypes.DEFAULT_T
             parse_mode=ParseMode.HTML
         )
         
-        # Inicializar el buffer de contenido
-        state_manager.set_data(user.id, "content_buffer", "")
+        # Inicializar el buffer de contenido (lista de fragmentos) y su longitud total
+        state_manager.set_data_many(user.id, {"content_buffer": [], "content_length": 0})
         
         # Actualizar el paso actual
         state_manager.set_data(user.id, "content_step", "waiting_content")
     
-    elif text.startswith("http://") or text.startswith("https://"):
+    elif text.startswith(URL_PREFIXES):
         # El usuario ha enviado una URL
         state_manager.set_data(user.id, "post_url", text)
         
@@ -191,7 +339,7 @@ async def process_content(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if text.strip() == "/fin":
         # El usuario ha terminado de escribir contenido
-        content_buffer = state_manager.get_data(user.id, "content_buffer", "")
+        content_buffer = _get_content_buffer(user.id)
         
         if not content_buffer:
             await context.bot.send_message(
@@ -201,7 +349,14 @@ async def process_content(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         # Guardar el contenido final
-        html_content = content_buffer.strip()
+        html_content = "\n".join(content_buffer).strip()
+        
+        # Confirmar todo lo recibido: los últimos fragmentos de un pegado
+        # rápido pueden no haber tenido acuse de recibo individual
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text=f"✅ Contenido completo: {len(content_buffer)} fragmentos, {len(html_content)} caracteres."
+        )
         
         # TODO: Procesar y validar el HTML
         
@@ -216,55 +371,54 @@ async def process_content(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await request_category(update, context)
     
     else:
-        # Agregar el texto al buffer de contenido
-        content_buffer = state_manager.get_data(user.id, "content_buffer", "")
-        content_buffer += text + "\n"
-        state_manager.set_data(user.id, "content_buffer", content_buffer)
+        # Agregar el texto al buffer de contenido. La longitud total se guarda
+        # aparte para no recorrer todos los fragmentos en cada mensaje.
+        content_buffer = _get_content_buffer(user.id)
+        if content_buffer is None:
+            content_buffer = []
+        content_length = state_manager.get_data(user.id, "content_length")
+        if content_length is None:
+            # Estado sin contador (anterior a este campo): se calcula una sola vez
+            content_length = sum(map(len, content_buffer))
+        content_length += len(text)
+        
+        # Rechazar el fragmento si el contenido superaría el tamaño máximo
+        if content_length > MAX_CONTENT_LENGTH:
+            await context.bot.send_message(
+                chat_id=chat_id,
+                text=(
+                    f"⚠️ El contenido no puede superar los {MAX_CONTENT_LENGTH} caracteres. "
+                    "Este fragmento no se ha añadido; envía /fin para terminar con lo que ya has escrito."
+                )
+            )
+            return
+        
+        content_buffer.append(text)
+        state_manager.set_data_many(user.id, {"content_buffer": content_buffer, "content_length": content_length})
         
         # Confirmar recepción
-        await context.bot.send_message(
-            chat_id=chat_id,
-            text="✅ Contenido recibido. Continúa escribiendo o envía /fin cuando hayas terminado."
-        )
+        now = time.monotonic()
+        if (len(content_buffer) % CONTENT_ACK_EVERY == 1
+                or now - context.user_data.get("content_last_ack", 0.0) > CONTENT_ACK_INTERVAL):
+            context.user_data["content_last_ack"] = now
+            await context.bot.send_message(
+                chat_id=chat_id,
+                text="✅ Contenido recibido. Continúa escribiendo o envía /fin cuando hayas terminado."
+            )
 
 async def request_category(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Solicita al usuario que seleccione una categoría."""
     user = update.effective_user
     chat_id = update.effective_chat.id
     
-    # Cargar categorías disponibles desde el archivo JSON de plantilla
-    try:
-        with open(CATEGORIES_TEMPLATE, 'r', encoding='utf-8') as f:
-            categories_data = json.load(f)
-            categories = categories_data['categories']
-    except Exception as e:
-        logger.error(f"Error al cargar las categorías: {e}")
-        categories = [
-            {"id": "desarrollo", "name": "Desarrollo"},
-            {"id": "salud", "name": "Salud"},
-            {"id": "alimentacion", "name": "Alimentación"},
-            {"id": "crianza", "name": "Crianza"},
-            {"id": "embarazo", "name": "Embarazo"},
-            {"id": "pareja", "name": "Pareja"}
-        ]
-    
-    # Crear teclado con las categorías
-    keyboard = []
-    row = []
-    for i, category in enumerate(categories):
-        row.append(InlineKeyboardButton(category['name'], callback_data=f"content:category:{category['id']}"))
-        if (i + 1) % 2 == 0 or i == len(categories) - 1:
-            keyboard.append(row)
-            row = []
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    categories, _ = await _load_categories()
     
     await context.bot.send_message(
         chat_id=chat_id,
         text=(
             "🔖 <b>Selecciona una categoría para tu artículo:</b>"
         ),
-        reply_markup=reply_markup,
+        reply_markup=_category_markup(categories),
         parse_mode=ParseMode.HTML
     )
     
@@ -275,11 +429,12 @@ async def process_image(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Procesa la imagen enviada por el usuario."""
     user = update.effective_user
     chat_id = update.effective_chat.id
+    message = update.message
     
     # Comprobar si se envió una imagen
-    if update.message.photo:
+    if message.photo:
         # Obtener la foto de mayor resolución
-        photo = update.message.photo[-1]
+        photo = message.photo[-1]
         file_id = photo.file_id
         
         # TODO: Descargar y procesar la imagen
@@ -292,10 +447,8 @@ async def process_image(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Mostrar resumen y solicitar confirmación
         await show_post_summary(update, context)
     
-    elif update.message.text and (update.message.text.startswith("http://") or update.message.text.startswith("https://")):
+    elif message.text and (image_url := message.text.strip()).startswith(URL_PREFIXES):
         # El usuario ha enviado una URL de imagen
-        image_url = update.message.text.strip()
-        
         # TODO: Validar que la URL sea una imagen
         
         # Guardar la URL de la imagen
@@ -319,12 +472,15 @@ async def show_post_summary(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     
     # Obtener los datos del post
-    title = state_manager.get_data(user.id, "post_title")
-    description = state_manager.get_data(user.id, "post_description")
-    url = state_manager.get_data(user.id, "post_url")
-    image = state_manager.get_data(user.id, "post_image")
-    category = state_manager.get_data(user.id, "post_category")
-    slug = state_manager.get_data(user.id, "post_slug")
+    title, description, url, image, category, slug = state_manager.get_data_many(user.id, POST_DATA_KEYS)
+    summary = {
+        "title": _html(title),
+        "description": _html(description),
+        "url": _html(url),
+        "image": _html(image or "No especificada"),
+        "category": _html(category),
+        "slug": _html(slug),
+    }
     
     # Crear botones de confirmación
     keyboard = [
@@ -337,16 +493,7 @@ async def show_post_summary(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await context.bot.send_message(
         chat_id=chat_id,
-        text=(
-            "<b>📋 Resumen del Post</b>\n\n"
-            f"<b>Título:</b> {title}\n"
-            f"<b>Descripción:</b> {description}\n"
-            f"<b>URL:</b> {url}\n"
-            f"<b>Imagen:</b> {image if image else 'No especificada'}\n"
-            f"<b>Categoría:</b> {category}\n"
-            f"<b>Slug:</b> {slug}\n\n"
-            "¿Deseas publicar este artículo?"
-        ),
+        text=SUMMARY_TEMPLATE.format_map(summary),
         reply_markup=reply_markup,
         parse_mode=ParseMode.HTML
     )
@@ -366,15 +513,9 @@ async def content_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if action == "category":
         category_id = data_parts[2]
         
-        # Cargar categorías para obtener el nombre
-        try:
-            with open(CATEGORIES_TEMPLATE, 'r', encoding='utf-8') as f:
-                categories_data = json.load(f)
-                categories = {cat['id']: cat['name'] for cat in categories_data['categories']}
-                category_name = categories.get(category_id, category_id.capitalize())
-        except Exception as e:
-            logger.error(f"Error al cargar las categorías: {e}")
-            category_name = category_id.capitalize()
+        # Obtener el nombre de la categoría desde el índice en caché
+        _, categories_by_id = await _load_categories()
+        category_name = categories_by_id.get(category_id, category_id.capitalize())
         
         # Guardar la categoría
         state_manager.set_data(user.id, "post_category", category_name)
@@ -391,7 +532,7 @@ async def content_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "✅ Categoría seleccionada: <b>{}</b>\n\n"
                 "Ahora, por favor envía una <b>imagen destacada</b> para el artículo.\n"
                 "Puedes subir una imagen directamente o enviar una URL de imagen."
-            ).format(category_name),
+            ).format(_html(category_name)),
             parse_mode=ParseMode.HTML
         )
         
@@ -402,13 +543,7 @@ async def content_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if data_parts[2] == "publish":
             # Publicar el post
             # Obtener los datos del post
-            title = state_manager.get_data(user.id, "post_title")
-            description = state_manager.get_data(user.id, "post_description")
-            url = state_manager.get_data(user.id, "post_url")
-            image = state_manager.get_data(user.id, "post_image")
-            category = state_manager.get_data(user.id, "post_category")
-            category_id = state_manager.get_data(user.id, "post_category_id")
-            slug = state_manager.get_data(user.id, "post_slug")
+            title, description, url, image, category, slug = state_manager.get_data_many(user.id, POST_DATA_KEYS)
             
             # Generar un ID único
             post_id = str(uuid.uuid4())
@@ -427,8 +562,8 @@ async def content_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
             # Intentar subir el post al servidor vía SFTP
             try:
-                # Importamos la función de subida SFTP
-                from ..sftp.handlers import upload_post_to_sftp
+                if upload_post_to_sftp is None:
+                    raise ImportError("Módulo SFTP no disponible")
                 
                 # Mensaje de estado temporal
                 await query.edit_message_text(
@@ -452,15 +587,17 @@ async def content_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 
                 # Guardamos el post en el estado del usuario (historial)
                 user_posts = state_manager.get_data(user.id, "user_posts", [])
+                index = _user_posts_index(user.id, user_posts)
                 user_posts.append(new_post)
-                state_manager.set_data(user.id, "user_posts", user_posts)
+                index[post_id] = len(user_posts) - 1
+                state_manager.set_data_many(user.id, {"user_posts": user_posts, "user_posts_index": index})
                 
             except ImportError:
                 # Si el módulo SFTP no está disponible
                 await query.edit_message_text(
                     text=(
                         "🎉 <b>¡Post Creado Exitosamente!</b>\n\n"
-                        f"Tu artículo '<b>{title}</b>' ha sido creado.\n\n"
+                        f"Tu artículo '<b>{_html(title)}</b>' ha sido creado.\n\n"
                         "⚠️ El módulo SFTP no está disponible. No se ha podido subir al servidor."
                     ),
                     parse_mode=ParseMode.HTML
@@ -471,8 +608,8 @@ async def content_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await query.edit_message_text(
                     text=(
                         "🎉 <b>¡Post Creado Exitosamente!</b>\n\n"
-                        f"Tu artículo '<b>{title}</b>' ha sido creado.\n\n"
-                        f"⚠️ Error al subir al servidor: {str(e)}"
+                        f"Tu artículo '<b>{_html(title)}</b>' ha sido creado.\n\n"
+                        f"⚠️ Error al subir al servidor: {_html(e)}"
                     ),
                     parse_mode=ParseMode.HTML
                 )
@@ -515,13 +652,9 @@ async def content_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Manejar confirmación/cancelación de guardar cambios
         if data_parts[2] == "confirm":
             # Obtener los datos del post
-            post_id = state_manager.get_data(user.id, "editing_post_id")
-            title = state_manager.get_data(user.id, "post_title")
-            description = state_manager.get_data(user.id, "post_description")
-            url = state_manager.get_data(user.id, "post_url")
-            image = state_manager.get_data(user.id, "post_image")
-            category = state_manager.get_data(user.id, "post_category")
-            slug = state_manager.get_data(user.id, "post_slug")
+            post_id, title, description, url, image, category, slug = state_manager.get_data_many(
+                user.id, ("editing_post_id",) + POST_DATA_KEYS
+            )
             
             # Actualizar el post
             updated_post = {
@@ -537,17 +670,16 @@ async def content_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
             # Actualizar lista de posts del usuario
             user_posts = state_manager.get_data(user.id, "user_posts", [])
-            for i, post in enumerate(user_posts):
-                if post.get('id') == post_id:
-                    user_posts[i] = updated_post
-                    break
+            i = _user_posts_index(user.id, user_posts).get(post_id)
+            if i is not None:
+                user_posts[i] = updated_post
             
             state_manager.set_data(user.id, "user_posts", user_posts)
             
             # Intentar subir el post actualizado al servidor vía SFTP
             try:
-                # Importamos la función de subida SFTP
-                from ..sftp.handlers import upload_post_to_sftp
+                if upload_post_to_sftp is None:
+                    raise ImportError("Módulo SFTP no disponible")
                 
                 # Mensaje de estado temporal
                 await query.edit_message_text(
@@ -574,7 +706,7 @@ async def content_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await query.edit_message_text(
                     text=(
                         "✅ <b>¡Post Actualizado Exitosamente!</b>\n\n"
-                        f"Tu artículo '<b>{title}</b>' ha sido actualizado.\n\n"
+                        f"Tu artículo '<b>{_html(title)}</b>' ha sido actualizado.\n\n"
                         "⚠️ El módulo SFTP no está disponible. No se ha podido subir al servidor."
                     ),
                     parse_mode=ParseMode.HTML
@@ -585,8 +717,8 @@ async def content_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await query.edit_message_text(
                     text=(
                         "✅ <b>¡Post Actualizado Exitosamente!</b>\n\n"
-                        f"Tu artículo '<b>{title}</b>' ha sido actualizado.\n\n"
-                        f"⚠️ Error al subir al servidor: {str(e)}"
+                        f"Tu artículo '<b>{_html(title)}</b>' ha sido actualizado.\n\n"
+                        f"⚠️ Error al subir al servidor: {_html(e)}"
                     ),
                     parse_mode=ParseMode.HTML
                 )
@@ -619,7 +751,7 @@ async def process_edit_field(update: Update, context: ContextTypes.DEFAULT_TYPE,
         await query.edit_message_text(
             text=(
                 "📝 <b>Editar Título</b>\n\n"
-                f"Título actual: <i>{current_value}</i>\n\n"
+                f"Título actual: <i>{_html(current_value)}</i>\n\n"
                 "Envía el nuevo título para tu artículo:"
             ),
             parse_mode=ParseMode.HTML
@@ -630,7 +762,7 @@ async def process_edit_field(update: Update, context: ContextTypes.DEFAULT_TYPE,
         await query.edit_message_text(
             text=(
                 "📋 <b>Editar Descripción</b>\n\n"
-                f"Descripción actual: <i>{current_value[:100]}...</i>\n\n"
+                f"Descripción actual: <i>{_html(current_value[:100])}...</i>\n\n"
                 "Envía la nueva descripción para tu artículo:"
             ),
             parse_mode=ParseMode.HTML
@@ -641,7 +773,7 @@ async def process_edit_field(update: Update, context: ContextTypes.DEFAULT_TYPE,
         await query.edit_message_text(
             text=(
                 "🌐 <b>Editar Contenido</b>\n\n"
-                f"URL actual: <i>{current_url}</i>\n\n"
+                f"URL actual: <i>{_html(current_url)}</i>\n\n"
                 "Envía una nueva URL o el contenido HTML para tu artículo:"
             ),
             parse_mode=ParseMode.HTML
@@ -674,28 +806,17 @@ async def content_message_handler(update: Update, context: ContextTypes.DEFAULT_
     """Manejador de mensajes para el módulo de contenido."""
     user = update.effective_user
     
+    state = state_manager.get_state(user.id)
+    
     # Verificar si el usuario está en proceso de creación de contenido
-    if state_manager.get_state(user.id) == State.CREATING_CONTENT:
-        current_step = state_manager.get_data(user.id, "content_step")
-        
-        if current_step == "waiting_title":
-            await process_title(update, context)
-            return True
-        elif current_step == "waiting_description":
-            await process_description(update, context)
-            return True
-        elif current_step == "waiting_url_or_content":
-            await process_url_or_content(update, context)
-            return True
-        elif current_step == "waiting_content":
-            await process_content(update, context)
-            return True
-        elif current_step == "waiting_image":
-            await process_image(update, context)
+    if state == State.CREATING_CONTENT:
+        handler = STEP_HANDLERS.get(state_manager.get_data(user.id, "content_step"))
+        if handler:
+            await handler(update, context)
             return True
     
     # Verificar si el usuario está en proceso de edición de contenido
-    elif state_manager.get_state(user.id) == State.EDITING_CONTENT:
+    elif state == State.EDITING_CONTENT:
         # Si hay un campo específico en edición, procesarlo
         if state_manager.get_data(user.id, "editing_field"):
             handled = await process_edit_field(update, context)
@@ -705,6 +826,15 @@ async def content_message_handler(update: Update, context: ContextTypes.DEFAULT_
     # Si no está en proceso de creación o edición, dejamos que otros manejadores procesen el mensaje
     return False
 
+# Función que procesa cada paso de la creación de contenido
+STEP_HANDLERS = {
+    "waiting_title": process_title,
+    "waiting_description": process_description,
+    "waiting_url_or_content": process_url_or_content,
+    "waiting_content": process_content,
+    "waiting_image": process_image,
+}
+
 async def editpost_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Manejador para el comando /editpost."""
     user = update.effective_user
@@ -721,12 +851,9 @@ async def editpost_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not user_posts:
         # Si no hay posts, intentar cargar desde una simulación
         try:
-            # Cargar posts desde plantilla como ejemplo
-            templates_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 
-                                         'data', 'templates')
-            with open(os.path.join(templates_dir, 'posts.json'), 'r', encoding='utf-8') as f:
-                posts_data = json.load(f)
-                user_posts = posts_data.get("posts", [])
+            # Cargar posts desde plantilla como ejemplo (en caché)
+            entry = await _load_template_async(POSTS_TEMPLATE)
+            user_posts = entry["data"].get("posts", []) if entry is not None else []
             
             if not user_posts:
                 raise ValueError("No hay posts disponibles")
@@ -747,25 +874,24 @@ async def editpost_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Limitar a 10 posts para evitar botones excesivos
     user_posts = user_posts[:10]
     
-    # Crear teclado con los posts disponibles
-    keyboard = []
-    for post in user_posts:
-        keyboard.append([
-            InlineKeyboardButton(
-                text=f"📝 {post['title'][:30]}...", 
-                callback_data=f"content:edit:{post['id']}"
-            )
-        ])
-    
-    # Añadir botón para cancelar
-    keyboard.append([
-        InlineKeyboardButton(
-            text="❌ Cancelar", 
-            callback_data="content:edit:cancel"
-        )
-    ])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # Reutilizar el teclado de la vez anterior si los posts no han cambiado.
+    # Se guarda en context.user_data porque el estado se serializa a JSON.
+    markup_key = tuple((post['id'], post['title']) for post in user_posts)
+    cached = context.user_data.get("editpost_markup")
+    if cached is not None and cached[0] == markup_key:
+        reply_markup = cached[1]
+    else:
+        # Crear teclado con los posts disponibles
+        keyboard = [
+            [InlineKeyboardButton(text=f"📝 {post['title'][:30]}...", callback_data=f"content:edit:{post['id']}")]
+            for post in user_posts
+        ]
+        
+        # Añadir botón para cancelar
+        keyboard.append([InlineKeyboardButton(text="❌ Cancelar", callback_data="content:edit:cancel")])
+        
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        context.user_data["editpost_markup"] = (markup_key, reply_markup)
     
     # Mostrar mensaje con los posts disponibles
     await context.bot.send_message(
@@ -786,25 +912,22 @@ async def load_post_for_editing(update: Update, context: ContextTypes.DEFAULT_TY
     
     # Obtener posts del usuario
     user_posts = state_manager.get_data(user.id, "user_posts", [])
+    selected_post = None
     
-    # Si no hay posts en el estado, intentar cargar desde plantilla
-    if not user_posts:
+    if user_posts:
+        # Buscar el post por ID en el índice de posts del usuario
+        i = _user_posts_index(user.id, user_posts).get(post_id)
+        if i is not None:
+            selected_post = user_posts[i]
+    else:
+        # Si no hay posts en el estado, buscarlo en la plantilla (en caché)
         try:
-            templates_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 
-                                         'data', 'templates')
-            with open(os.path.join(templates_dir, 'posts.json'), 'r', encoding='utf-8') as f:
-                posts_data = json.load(f)
-                user_posts = posts_data.get("posts", [])
+            entry = await _load_template_async(POSTS_TEMPLATE)
+            if entry is not None:
+                selected_post = _load_template_posts_by_id(entry).get(post_id)
         except Exception as e:
             logger.error(f"Error al cargar posts de plantilla: {e}")
     
-    # Buscar el post por ID
-    selected_post = None
-    for post in user_posts:
-        if post.get('id') == post_id:
-            selected_post = post
-            break
-    
     if not selected_post:
         await query.edit_message_text(
             text=(
@@ -816,15 +939,20 @@ async def load_post_for_editing(update: Update, context: ContextTypes.DEFAULT_TY
         state_manager.set_state(user.id, State.IDLE)
         return
     
-    # Guardar datos del post en el estado
-    state_manager.set_data(user.id, "editing_post_id", post_id)
-    state_manager.set_data(user.id, "post_original", selected_post)
-    state_manager.set_data(user.id, "post_title", selected_post.get('title', ''))
-    state_manager.set_data(user.id, "post_description", selected_post.get('description', ''))
-    state_manager.set_data(user.id, "post_url", selected_post.get('url', ''))
-    state_manager.set_data(user.id, "post_image", selected_post.get('image', ''))
-    state_manager.set_data(user.id, "post_category", selected_post.get('category', ''))
-    state_manager.set_data(user.id, "post_slug", selected_post.get('slug', ''))
+    # Copia propia del post: el de la plantilla está compartido en la caché
+    selected_post = dict(selected_post)
+    
+    # Guardar datos del post en el estado (una sola escritura)
+    state_manager.set_data_many(user.id, {
+        "editing_post_id": post_id,
+        "post_original": selected_post,
+        "post_title": selected_post.get('title', ''),
+        "post_description": selected_post.get('description', ''),
+        "post_url": selected_post.get('url', ''),
+        "post_image": selected_post.get('image', ''),
+        "post_category": selected_post.get('category', ''),
+        "post_slug": selected_post.get('slug', ''),
+    })
     
     # Crear teclado con opciones de edición
     keyboard = [
@@ -842,9 +970,9 @@ async def load_post_for_editing(update: Update, context: ContextTypes.DEFAULT_TY
     # Mostrar resumen del post a editar
     await query.edit_message_text(
         text=(
-            f"📝 <b>Editando: {selected_post['title']}</b>\n\n"
-            f"<b>Descripción:</b> {selected_post['description'][:100]}...\n"
-            f"<b>Categoría:</b> {selected_post['category']}\n\n"
+            f"📝 <b>Editando: {_html(selected_post['title'])}</b>\n\n"
+            f"<b>Descripción:</b> {_html(selected_post['description'][:100])}...\n"
+            f"<b>Categoría:</b> {_html(selected_post['category'])}\n\n"
             "Selecciona qué campo deseas editar:"
         ),
         reply_markup=reply_markup,
@@ -866,7 +994,7 @@ async def request_edit_field(update: Update, context: ContextTypes.DEFAULT_TYPE,
         await query.edit_message_text(
             text=(
                 "📝 <b>Editar Título</b>\n\n"
-                f"Título actual: <i>{current_value}</i>\n\n"
+                f"Título actual: <i>{_html(current_value)}</i>\n\n"
                 "Envía el nuevo título para tu artículo:"
             ),
             parse_mode=ParseMode.HTML
@@ -877,7 +1005,7 @@ async def request_edit_field(update: Update, context: ContextTypes.DEFAULT_TYPE,
         await query.edit_message_text(
             text=(
                 "📋 <b>Editar Descripción</b>\n\n"
-                f"Descripción actual: <i>{current_value[:100]}...</i>\n\n"
+                f"Descripción actual: <i>{_html(current_value[:100])}...</i>\n\n"
                 "Envía la nueva descripción para tu artículo:"
             ),
             parse_mode=ParseMode.HTML
@@ -888,7 +1016,7 @@ async def request_edit_field(update: Update, context: ContextTypes.DEFAULT_TYPE,
         await query.edit_message_text(
             text=(
                 "🌐 <b>Editar Contenido</b>\n\n"
-                f"URL actual: <i>{current_url}</i>\n\n"
+                f"URL actual: <i>{_html(current_url)}</i>\n\n"
                 "Envía una nueva URL o el contenido HTML para tu artículo:"
             ),
             parse_mode=ParseMode.HTML
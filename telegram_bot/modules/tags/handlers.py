@@ -131,11 +131,8 @@ async def enter_tag_name(update: Update, context: CallbackContext) -> int:
         )
         return ENTER_TAG_NAME
     
-    # Validar que no exista ya una etiqueta con ese nombre
-    tags_data = load_tags()
-    tags = tags_data.get("tags", [])
-    
-    if any(tag["name"].lower() == tag_name.lower() for tag in tags):
+    # Validar que no exista ya una etiqueta con ese nombre (índice por nombre en minúsculas)
+    if Tag.get_by_name(tag_name) is not None:
         await update.message.reply_text(
             "⚠️ Ya existe una etiqueta con ese nombre. Por favor, elige otro nombre."
         )
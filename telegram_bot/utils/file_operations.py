@@ -8,12 +8,24 @@ como leer y escribir archivos JSON, copiar archivos, etc.
 import json
 import os
 import logging
+import stat
+import tempfile
 from pathlib import Path
 from typing import Any, Dict, Union, List
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Logger
 logger = logging.getLogger(__name__)
 
+# umask del proceso, para dar a los archivos nuevos los mismos permisos que open().
+# Solo se puede consultar cambiándola, así que se lee una vez al importar.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
 def ensure_dir_exists(directory: Union[str, Path]) -> None:
     """
     Asegura que un directorio exista, creándolo si no existe.
@@ -35,6 +47,9 @@ def read_json_file(file_path: Union[str, Path]) -> Dict[str, Any]:
     """
     Lee un archivo JSON y devuelve su contenido.
     
+    Si orjson está disponible se decodifica directamente desde los bytes
+    del archivo, evitando el decodificador de la librería estándar.
+    
     Args:
         file_path: Ruta al archivo JSON
         
@@ -49,10 +64,13 @@ def read_json_file(file_path: Union[str, Path]) -> Dict[str, Any]:
         file_path = Path(file_path)
     
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-            logger.debug(f"Archivo JSON leído: {file_path}")
-            return data
+        if orjson is not None:
+            data = orjson.loads(file_path.read_bytes())
+        else:
+            with open(file_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        logger.debug(f"Archivo JSON leído: {file_path}")
+        return data
     except FileNotFoundError:
         logger.error(f"Archivo no encontrado: {file_path}")
         raise
@@ -67,6 +85,13 @@ def write_json_file(file_path: Union[str, Path], data: Dict[str, Any], indent: i
     """
     Escribe datos en un archivo JSON.
     
+    El contenido se escribe primero en un archivo temporal del mismo
+    directorio y después se renombra de forma atómica, de modo que ningún
+    lector ve nunca un archivo a medio escribir. Si orjson está disponible
+    se usa para serializar (solo con indent=2, el único que soporta); si no
+    puede serializar los datos (claves no str, enteros de más de 64 bits)
+    se recurre a json.
+    
     Args:
         file_path: Ruta donde guardar el archivo JSON
         data: Datos a escribir en el archivo
@@ -81,13 +106,38 @@ def write_json_file(file_path: Union[str, Path], data: Dict[str, Any], indent: i
     # Asegurar que el directorio existe
     ensure_dir_exists(file_path.parent)
     
+    tmp_path = None
     try:
-        with open(file_path, 'w', encoding='utf-8') as file:
-            json.dump(data, file, indent=indent, ensure_ascii=False)
-            logger.debug(f"Archivo JSON escrito: {file_path}")
+        payload = None
+        if orjson is not None and indent == 2:
+            try:
+                payload = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+            except TypeError:
+                # orjson.JSONEncodeError hereda de TypeError
+                payload = None
+        if payload is None:
+            payload = json.dumps(data, indent=indent, ensure_ascii=False).encode('utf-8')
+        
+        fd, tmp_path = tempfile.mkstemp(dir=file_path.parent, prefix=f".{file_path.name}.", suffix=".tmp")
+        with os.fdopen(fd, 'wb') as file:
+            file.write(payload)
+        
+        # Conservar los permisos del archivo original si ya existía; si no,
+        # los que daría open() según la umask (mkstemp crea el archivo con 0600)
+        if file_path.exists():
+            mode = stat.S_IMODE(file_path.stat().st_mode)
+        else:
+            mode = 0o666 & ~_UMASK
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, file_path)
+        tmp_path = None
+        logger.debug(f"Archivo JSON escrito: {file_path}")
     except Exception as e:
         logger.error(f"Error al escribir archivo JSON {file_path}: {e}")
         raise
+    finally:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
 def backup_file(file_path: Union[str, Path], backup_dir: Union[str, Path] = None) -> Path:
     """
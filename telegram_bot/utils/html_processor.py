@@ -113,7 +113,7 @@ def extract_images_from_html(html_content):
             src = img.get('src', '')
             
             # Ignorar imágenes base64 o URLs externas
-            if src.startswith('data:') or src.startswith('http'):
+            if src.startswith(('data:', 'http')):
                 continue
                 
             alt = img.get('alt', '')